@@ -0,0 +1,82 @@
+from contextlib import redirect_stdout
+import numpy as np
+import random
+import time
+import yaml
+import io
+import sys
+sys.path.append("../rag")
+from bm25 import BM25, BM25Index, preprocess_persian_batch, lemma_cache_stats
+from document_store import DocumentStore
+
+def retrieve_before(retriever, documents, query, limit, threshold):
+    # Retrieval as done before the document store: full argsort and an object array of every Document
+    scores = retriever.get_scores(query)
+    sorted_scores_indices = np.argsort(scores)[::-1][:limit]
+    high_scores = scores[sorted_scores_indices] > threshold
+    return np.asarray(documents)[sorted_scores_indices][high_scores]
+
+def time_queries(retrieve, queries, repeats):
+    latencies = []
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            for query in queries:
+                start = time.perf_counter()
+                retrieve(query)
+                latencies.append(time.perf_counter() - start)
+    return np.median(latencies) * 1000
+
+def main() -> None:
+    # Load parameters
+    params = yaml.safe_load(open("params.yaml"))["rag"]
+    k1 = params["bm25_k1"]
+    b = params["bm25_b"]
+    limit = params["num_retrieved"]
+    threshold = params["bm25_score_threshold"]
+    corpus_sizes = [1_000, 10_000, 50_000, 100_000]
+    num_queries = 50
+    repeats = 3
+
+    print("Load documents...")
+    store = DocumentStore.read([
+        "data/prepared/ghazal_documents.parquet",
+        "data/prepared/masnavi_documents.parquet",
+        "data/prepared/programs_documents.parquet",
+    ])
+
+    print("Preprocess documents...")
+    preprocessed_documents = preprocess_persian_batch(
+        store.texts(),
+        num_workers=params["bm25_num_workers"],
+    )
+    print(f"Lemma cache: {lemma_cache_stats()}")
+
+    random.seed(0)
+    queries = random.sample(preprocessed_documents, num_queries)
+
+    print(f"{'documents':>10} | {'before (ms)':>12} | {'after (ms)':>11}")
+    for corpus_size in corpus_sizes:
+        # Repeat the corpus when a size is larger than the real one
+        rows = np.arange(corpus_size) % len(store)
+        corpus_documents = store.take(rows)
+        corpus_tokens = [preprocessed_documents[row] for row in rows]
+
+        retriever = BM25Index.build(corpus_tokens, k1=k1, b=b)
+
+        bm25 = BM25()
+        bm25.retriever = retriever
+        bm25.documents = DocumentStore.from_documents(corpus_documents)
+
+        before = time_queries(
+            lambda query: retrieve_before(retriever, corpus_documents, query, limit, threshold),
+            queries, repeats
+        )
+        after = time_queries(
+            lambda query: bm25.retrieve(query, limit=limit, threshold=threshold),
+            queries, repeats
+        )
+
+        print(f"{corpus_size:>10} | {before:>12.3f} | {after:>11.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import numpy as np
+import random
+import time
+import yaml
+import sys
+sys.path.append("../rag")
+from load_model import load_cross_encoder, load_embeddings, configure_torch_threads
+from reranker import RERANKER_MODEL
+from document_store import DocumentStore
+
+# (backend, device, dtype), auto resolves to the accelerator of the machine if there is one
+CONFIGURATIONS = [
+    ("torch", "auto", "auto"),
+    ("torch", "cpu", "float32"),
+    ("torch", "cpu", "bfloat16"),
+    ("torch_int8", "cpu", "float32"),
+    ("onnx", "cpu", "float32"),
+    ("onnx_int8", "cpu", "float32"),
+]
+
+def throughput(run, num_items, repeats):
+    # The first run warms up kernels and allocators and is not timed
+    run()
+    elapsed = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        elapsed.append(time.perf_counter() - start)
+    return num_items / np.median(elapsed)
+
+def main() -> None:
+    # Load parameters
+    params = yaml.safe_load(open("params.yaml"))
+    embedding_params = params["create_embeddings"]
+    rag_params = params["rag"]
+    batch_size = rag_params["reranker_batch_size"]
+    num_documents = 256
+    repeats = 3
+
+    configure_torch_threads(rag_params["torch_num_threads"], rag_params["torch_num_interop_threads"])
+
+    print("Load documents...")
+    store = DocumentStore.read([
+        "data/prepared/ghazal_documents.parquet",
+        "data/prepared/masnavi_documents.parquet",
+        "data/prepared/programs_documents.parquet",
+    ])
+
+    random.seed(0)
+    all_texts = store.texts()
+    texts = [all_texts[row] for row in random.sample(range(len(store)), num_documents)]
+    pairs = [[texts[0], text] for text in texts]
+
+    results = []
+    for backend, device, dtype in CONFIGURATIONS:
+        embeddings = load_embeddings(
+            embedding_params["embedding_model"],
+            embedding_params["embedding_size"],
+            backend=backend,
+            device=device,
+            dtype=dtype,
+            batch_size=embedding_params["embedding_batch_size"],
+        )
+        embedding_throughput = throughput(lambda: embeddings.embed_documents(texts), len(texts), repeats)
+        del embeddings
+
+        reranker = load_cross_encoder(
+            RERANKER_MODEL,
+            backend=backend,
+            device=device,
+            dtype=dtype,
+            max_length=rag_params["reranker_max_length"],
+            trust_remote_code=True,
+        )
+        rerank_throughput = throughput(
+            lambda: reranker.predict(pairs, batch_size=batch_size, show_progress_bar=False),
+            len(pairs), repeats
+        )
+        del reranker
+
+        results.append((backend, device, dtype, embedding_throughput, rerank_throughput))
+
+    print(f"{'backend':>10} | {'device':>6} | {'dtype':>8} | {'embed docs/s':>12} | {'rerank pairs/s':>14}")
+    for backend, device, dtype, embedding_throughput, rerank_throughput in results:
+        print(f"{backend:>10} | {device:>6} | {dtype:>8} | {embedding_throughput:>12.1f} | {rerank_throughput:>14.1f}")
+
+if __name__ == "__main__":
+    main()
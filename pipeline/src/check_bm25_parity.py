@@ -0,0 +1,51 @@
+from rank_bm25 import BM25Okapi
+from tqdm import tqdm
+import numpy as np
+import random
+import yaml
+import sys
+sys.path.append("../rag")
+from bm25 import BM25Index, preprocess_persian_batch, lemma_cache_stats
+from document_store import DocumentStore
+
+def main() -> None:
+    # Load parameters
+    params = yaml.safe_load(open("params.yaml"))["rag"]
+    k1 = params["bm25_k1"]
+    b = params["bm25_b"]
+    num_queries = 200
+
+    print("Load documents...")
+    store = DocumentStore.read([
+        "data/prepared/ghazal_documents.parquet",
+        "data/prepared/masnavi_documents.parquet",
+        "data/prepared/programs_documents.parquet",
+    ])
+
+    print("Preprocess documents...")
+    preprocessed_documents = preprocess_persian_batch(
+        store.texts(),
+        num_workers=params["bm25_num_workers"],
+    )
+    print(f"Lemma cache: {lemma_cache_stats()}")
+
+    print("Build both BM25 implementations...")
+    reference = BM25Okapi(preprocessed_documents, k1=k1, b=b)
+    index = BM25Index.build(preprocessed_documents, k1=k1, b=b)
+
+    # Use beyts and program chunks of the corpus as queries
+    random.seed(0)
+    queries = random.sample(preprocessed_documents, num_queries)
+
+    max_error = 0.0
+    for query in tqdm(queries, desc="Comparing scores"):
+        expected = reference.get_scores(query)
+        scores = index.get_scores(query)
+        max_error = max(max_error, float(np.abs(expected - scores).max()))
+
+        assert np.allclose(expected, scores, rtol=1e-5, atol=1e-5), f"Scores differ for query {query}"
+
+    print(f"BM25Index matches BM25Okapi on {num_queries} queries (max abs error: {max_error:.2e})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import pandas as pd
+import numpy as np
+import time
+import yaml
+import sys
+sys.path.append("../rag")
+from load_model import load_cross_encoder, load_embeddings
+from reranker import RERANKER_MODEL
+from rag import EMBEDDING_QUERY_INSTRUCTION
+
+# A candidate backend must keep nearly the same scores and the same best document as fp32 torch on CPU
+MIN_SCORE_CORRELATION = 0.99
+MIN_TOP1_AGREEMENT = 0.95
+
+def rerank_scores(model, questions, contexts, candidates):
+    scores = []
+    latencies = []
+
+    for question, rows in zip(questions, candidates):
+        start = time.perf_counter()
+        scores.append(model.predict(
+            [[question, contexts[row]] for row in rows],
+            batch_size=len(rows),
+            show_progress_bar=False
+        ))
+        latencies.append(time.perf_counter() - start)
+
+    return np.array(scores), np.median(latencies) * 1000
+
+def embedding_scores(embeddings, questions, contexts):
+    query_embeddings = []
+    latencies = []
+
+    for question in questions:
+        start = time.perf_counter()
+        query_embeddings.append(embeddings.embed_query(f"{EMBEDDING_QUERY_INSTRUCTION}{question}"))
+        latencies.append(time.perf_counter() - start)
+
+    query_embeddings = np.array(query_embeddings)
+    context_embeddings = np.array(embeddings.embed_documents(contexts))
+    return query_embeddings, query_embeddings @ context_embeddings.T, np.median(latencies) * 1000
+
+def compare(name, reference, candidate):
+    correlation = np.corrcoef(reference.ravel(), candidate.ravel())[0, 1]
+    top1_agreement = np.mean(reference.argmax(axis=1) == candidate.argmax(axis=1))
+    max_error = np.abs(reference - candidate).max()
+
+    print(f"{name}: correlation {correlation:.4f}, top-1 agreement {top1_agreement:.3f}, max abs error {max_error:.4f}")
+    assert correlation >= MIN_SCORE_CORRELATION, f"{name} scores drift from the torch backend"
+    assert top1_agreement >= MIN_TOP1_AGREEMENT, f"{name} ranks documents differently from the torch backend"
+
+def main() -> None:
+    # Load parameters
+    params = yaml.safe_load(open("params.yaml"))
+    embedding_params = params["create_embeddings"]
+    rag_params = params["rag"]
+    reranker_backend = rag_params["reranker_backend"]
+    embedding_backend = rag_params["embedding_backend"]
+    num_candidates = 10
+
+    print("Read evaluation dataset...")
+    evaluation_dataset = pd.read_parquet("data/prepared/evaluation_dataset.parquet")
+    questions = evaluation_dataset["question"].tolist()
+    contexts = evaluation_dataset["context"].tolist()
+
+    # Each question is reranked against its own context and random contexts of other questions
+    rng = np.random.default_rng(0)
+    candidates = [
+        [row] + rng.choice(np.delete(np.arange(len(contexts)), row), num_candidates - 1, replace=False).tolist()
+        for row in range(len(contexts))
+    ]
+
+    print(f"Compare reranker backends torch and {reranker_backend}...")
+    reference_scores, reference_latency = rerank_scores(
+        load_cross_encoder(RERANKER_MODEL, device="cpu", dtype="float32", trust_remote_code=True, max_length=rag_params["reranker_max_length"]),
+        questions, contexts, candidates
+    )
+    scores, latency = rerank_scores(
+        load_cross_encoder(RERANKER_MODEL, backend=reranker_backend, trust_remote_code=True, max_length=rag_params["reranker_max_length"]),
+        questions, contexts, candidates
+    )
+    print(f"Reranker latency per query: torch {reference_latency:.1f} ms, {reranker_backend} {latency:.1f} ms")
+    compare("Reranker", reference_scores, scores)
+
+    print(f"Compare embedding backends torch and {embedding_backend}...")
+    reference_embeddings, reference_similarities, reference_latency = embedding_scores(
+        load_embeddings(embedding_params["embedding_model"], embedding_params["embedding_size"], device="cpu", dtype="float32"),
+        questions, contexts
+    )
+    query_embeddings, similarities, latency = embedding_scores(
+        load_embeddings(embedding_params["embedding_model"], embedding_params["embedding_size"], backend=embedding_backend),
+        questions, contexts
+    )
+    cosine = np.sum(reference_embeddings * query_embeddings, axis=1)
+    print(f"Embedding latency per query: torch {reference_latency:.1f} ms, {embedding_backend} {latency:.1f} ms")
+    print(f"Query embedding cosine to torch: mean {cosine.mean():.4f}, min {cosine.min():.4f}")
+    compare("Embeddings", reference_similarities, similarities)
+
+if __name__ == "__main__":
+    main()
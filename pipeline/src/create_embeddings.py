@@ -1,15 +1,33 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_postgres import PGEngine
 from langchain_postgres import Column
 from langchain_postgres import PGVectorStore
-from langchain_postgres.v2.indexes import IVFFlatIndex, HNSWIndex
 from utils.dump_table import dump_table
-from utils.create_embeddings_ghazal import create_embeddings_ghazal
-from utils.create_embeddings_masnavi import create_embeddings_masnavi
-from utils.create_embeddings_programs import create_embeddings_programs
+from utils.common_embeddings import ingest_documents
+from utils.create_embeddings_ghazal import prepare_ghazal_documents
+from utils.create_embeddings_masnavi import prepare_masnavi_documents
+from utils.create_embeddings_programs import prepare_programs_documents
 from dotenv import dotenv_values
+from sqlalchemy import text
 import yaml
 import asyncio
+import sys
+sys.path.append("../rag")
+from pgvector_index import apply_vector_indexes, index_config, saved_index_config, save_index_config
+from database import Database
+from load_model import load_embeddings, configure_torch_threads
+
+def existing_document_ids(database, table_name, embedding_size):
+    """
+    Ids of the rows of the embedding table, None if the table is missing or has another vector size.
+    """
+    with database.sync_engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass(:table_name)"), {"table_name": table_name}).scalar() is None:
+            return None
+
+        vector_size = conn.execute(text(f'SELECT vector_dims("embedding") FROM "{table_name}" LIMIT 1')).scalar()
+        if vector_size is not None and vector_size != embedding_size:
+            return None
+
+        return {str(row[0]) for row in conn.execute(text(f'SELECT "langchain_id" FROM "{table_name}"'))}
 
 async def main() -> None:
     # Load config
@@ -20,47 +38,56 @@ async def main() -> None:
     embedding_model_name = params["embedding_model"]
     embedding_table_name = params["embedding_table_name"]
     embedding_size = params["embedding_size"]
+    pgvector_index_type = params["pgvector_index_type"]
 
-    pg_user = config["POSTGRES_USER"]
-    pg_password = config["POSTGRES_PASSWORD"]
-    pg_hostname = config["POSTGRES_HOSTNAME"]
-    pg_db = config["POSTGRES_DB"]
     hf_token = config["HF_TOKEN"]
 
-    connection_string = f"postgresql+psycopg://{pg_user}:{pg_password}@{pg_hostname}/{pg_db}"
-
     # Load embedding model
     print("Load embedding model...")
-    embedding_model = HuggingFaceEmbeddings(
-        model_name=embedding_model_name,
-        encode_kwargs={
-            "normalize_embeddings": True,
-            "truncate_dim": embedding_size,
-        },
-        model_kwargs={
-            "token": hf_token
-        }
+    configure_torch_threads(params["torch_num_threads"], params["torch_num_interop_threads"])
+    embedding_model = load_embeddings(
+        embedding_model_name,
+        embedding_size,
+        device=params["embedding_device"],
+        dtype=params["embedding_dtype"],
+        batch_size=params["embedding_batch_size"],
+        token=hf_token,
     )
 
     # Create Postgres engine
     print("Connect to postgres...")
-    engine = PGEngine.from_connection_string(url=connection_string)
+    database = Database(
+        dotenv_path=".env",
+        pool_size=params["db_pool_size"],
+        max_overflow=params["db_max_overflow"],
+        pool_timeout=params["db_pool_timeout"],
+        pool_pre_ping=params["db_pool_pre_ping"],
+        statement_timeout_ms=params["db_statement_timeout_ms"],
+        prepare_threshold=params["db_prepare_threshold"],
+    )
+    engine = database.pg_engine
 
-    # Make sure the embedding table doesn't exists
-    print(f"Recreate {embedding_table_name} table...")
-    engine.drop_table(embedding_table_name)
+    # Rows are synced by content id, the table is only recreated when its vector size changes
+    existing_ids = existing_document_ids(database, embedding_table_name, embedding_size)
 
-    # Create embedding table
-    await engine.ainit_vectorstore_table(
-        table_name=embedding_table_name,
-        vector_size=embedding_size,
-        metadata_columns=[
-            Column("type", "VARCHAR"),
-            Column("number", "INTEGER"),
-            Column("part", "INTEGER"),
-            Column("translation", "VARCHAR"),
-        ],
-    )
+    if existing_ids is None:
+        print(f"Recreate {embedding_table_name} table...")
+        engine.drop_table(embedding_table_name)
+
+        # Create embedding table
+        await engine.ainit_vectorstore_table(
+            table_name=embedding_table_name,
+            vector_size=embedding_size,
+            metadata_columns=[
+                Column("type", "VARCHAR"),
+                Column("number", "INTEGER"),
+                Column("part", "INTEGER"),
+                Column("translation", "VARCHAR"),
+            ],
+        )
+        existing_ids = set()
+
+    print(f"{len(existing_ids)} documents already in {embedding_table_name}")
 
     print("Create PGVectorStore...")
     # Create pgvectore store
@@ -71,33 +98,81 @@ async def main() -> None:
         metadata_columns=["type", "number", "part", "translation"]
     )
     
-    create_embeddings_programs(vector_store)
-    create_embeddings_ghazal(vector_store)
-    create_embeddings_masnavi(vector_store)
+    # Ids depend on the embedding model and its configured dtype, changing them re-embeds
+    # every document. The dtype is taken as written, not as resolved on this machine,
+    # so the same params give the same ids on any hardware
+    id_scope = f"{embedding_model_name}:{embedding_size}:{params['embedding_dtype']}"
+    documents = (
+        prepare_programs_documents(id_scope)
+        + prepare_ghazal_documents(id_scope)
+        + prepare_masnavi_documents(id_scope)
+    )
+    document_ids = {doc.id for doc in documents}
+    new_documents = [doc for doc in documents if doc.id not in existing_ids]
+    print(f"{len(new_documents)} new or changed documents, {len(documents) - len(new_documents)} unchanged")
 
-    # Index data
-    print("Index data...")
-    
-    #index = HNSWIndex()
-    index = IVFFlatIndex()
-    
-    # Make sure no index exists
-    await vector_store.adrop_vector_index()
+    # Rows of removed or changed documents
+    vanished_ids = list(existing_ids - document_ids)
+    if vanished_ids:
+        print(f"Delete {len(vanished_ids)} vanished documents...")
+        await vector_store.adelete(vanished_ids)
+
+    config = index_config(
+        pgvector_index_type,
+        partial_types=params["pgvector_partial_types"],
+        lists=params["pgvector_lists"],
+        m=params["pgvector_m"],
+        ef_construction=params["pgvector_ef_construction"],
+    )
+
+    # pgvector keeps the indexes up to date on small changes, large loads are
+    # faster without indexes, which are then built once after the load
+    rebuild_index = (
+        saved_index_config(database, embedding_table_name) != config
+        or len(new_documents) > params["pgvector_rebuild_fraction"] * len(documents)
+    )
 
-    # Create a vector index
-    await vector_store.aapply_vector_index(index)
+    if rebuild_index:
+        # Without its config the table is rebuilt by the next run if this one is interrupted
+        save_index_config(database, embedding_table_name, None)
+        await apply_vector_indexes(vector_store, embedding_table_name, "exact", config["partial_types"])
+
+    ingest_documents(
+        database,
+        embedding_table_name,
+        embedding_model,
+        new_documents,
+        batch_size=params["ingest_batch_size"],
+        queue_size=params["ingest_queue_size"],
+    )
+
+    if rebuild_index:
+        # Index data
+        print(f"Index data with {pgvector_index_type}...")
+
+        # One index over all rows and one partial index per type, for searches filtered on a single type
+        await apply_vector_indexes(
+            vector_store,
+            embedding_table_name,
+            pgvector_index_type,
+            partial_types=config["partial_types"],
+            lists=config["lists"],
+            m=config["m"],
+            ef_construction=config["ef_construction"],
+        )
+        save_index_config(database, embedding_table_name, config)
 
     print("Dump embeddings table...")
 
     # Dump embedding table
     dump_table(
         table_name=embedding_table_name,
-        pg_user=pg_user,
-        pg_password=pg_password,
-        pg_hostname=pg_hostname,
-        pg_db=pg_db,
+        engine=database.sync_engine,
         output_path='data/prepared/embeddings.parquet'
     )
 
+    print(f"Postgres pool: {database.stats()}")
+    await database.close()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -2,9 +2,9 @@ from dotenv import dotenv_values
 from utils.load_model import load_llm
 from langchain_core.prompts import PromptTemplate
 from tqdm import tqdm
+import pandas as pd
 import pickle
 import yaml
-import random
 
 def main() -> None:
     # Load config
@@ -17,16 +17,11 @@ def main() -> None:
     question_generation_prompt = params["question_generation_prompt"]
 
     print("Load documents...")
-    with open(r"data/prepared/masnavi_documents.pkl", "rb") as f:
-        masnavi_documents = pickle.load(f)
-
-    with open(r"data/prepared/ghazal_documents.pkl", "rb") as f:
-        ghazal_documents = pickle.load(f)
-
-    with open(r"data/prepared/programs_documents.pkl", "rb") as f:
-        programs_documents = pickle.load(f)
-
-    documents = masnavi_documents + ghazal_documents + programs_documents
+    documents = pd.concat([
+        pd.read_parquet("data/prepared/masnavi_documents.parquet"),
+        pd.read_parquet("data/prepared/ghazal_documents.parquet"),
+        pd.read_parquet("data/prepared/programs_documents.parquet"),
+    ], ignore_index=True)
  
     # Load question generation model
     llm = load_llm(question_generation_model)
@@ -38,9 +33,9 @@ def main() -> None:
     print(f"Generating {num_questions} QA couples...")
 
     outputs = []
-    for sampled_context in tqdm(random.sample(documents, num_questions)):
+    for _, sampled_context in tqdm(documents.sample(num_questions).iterrows(), total=num_questions):
 
-        prompt = question_generation_template.invoke({"context": sampled_context.page_content})
+        prompt = question_generation_template.invoke({"context": sampled_context["page_content"]})
         generated_question_answer = llm.invoke(prompt).content
 
         try:
@@ -50,12 +45,12 @@ def main() -> None:
 
             outputs.append(
                 {
-                    "context": sampled_context.page_content,
+                    "context": sampled_context["page_content"],
                     "question": question,
                     "answer": answer,
-                    "type": sampled_context.metadata["type"],
-                    "number": sampled_context.metadata["number"],
-                    "part": sampled_context.metadata["part"],
+                    "type": sampled_context["type"],
+                    "number": sampled_context["number"],
+                    "part": sampled_context["part"],
                 }
             )
         except:
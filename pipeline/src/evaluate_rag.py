@@ -7,6 +7,7 @@ from dotenv import dotenv_values
 from tqdm import tqdm
 from langchain_core.prompts import PromptTemplate
 import asyncio
+import os
 
 import sys
 sys.path.append("../rag")
@@ -33,6 +34,9 @@ async def main() -> None:
     # Create RAG
     print("Create RAG...")
 
+    # Output of the stage, only filled when the vector backend is local
+    os.makedirs("data/index_vectors", exist_ok=True)
+
     reader_models = {
         "fast": rag_params["reader_models_fast"],
         "expert": rag_params["reader_models_expert"],
@@ -42,19 +46,60 @@ async def main() -> None:
         embedding_table_name = embedding_params["embedding_table_name"],
         embedding_model = embedding_params["embedding_model"],
         embedding_size = embedding_params["embedding_size"],
+        embedding_backend = rag_params["embedding_backend"],
+        inference_device=rag_params["inference_device"],
+        inference_dtype=rag_params["inference_dtype"],
+        torch_num_threads=rag_params["torch_num_threads"],
+        torch_num_interop_threads=rag_params["torch_num_interop_threads"],
         embedding_score_threshold=embedding_params["embedding_threshold_score"],
+        vector_backend=rag_params["vector_backend"],
+        vector_index_dtype=rag_params["vector_index_dtype"],
+        pgvector_index_type=embedding_params["pgvector_index_type"],
+        pgvector_probes=rag_params["pgvector_probes"],
+        pgvector_ef_search=rag_params["pgvector_ef_search"],
+        db_pool_size=rag_params["db_pool_size"],
+        db_max_overflow=rag_params["db_max_overflow"],
+        db_pool_timeout=rag_params["db_pool_timeout"],
+        db_pool_pre_ping=rag_params["db_pool_pre_ping"],
+        db_statement_timeout_ms=rag_params["db_statement_timeout_ms"],
+        db_prepare_threshold=rag_params["db_prepare_threshold"],
         bm25_score_threshold=rag_params["bm25_score_threshold"],
         bm25_k1=rag_params["bm25_k1"],
         bm25_b=rag_params["bm25_b"],
+        bm25_num_workers=rag_params["bm25_num_workers"],
+        fusion_method=rag_params["fusion_method"],
+        fusion_weights=rag_params["fusion_weights"],
+        fusion_rrf_k=rag_params["fusion_rrf_k"],
+        fusion_top_n=rag_params["fusion_top_n"],
         reranker_threshold=rag_params["reranker_threshold"],
+        reranker_backend=rag_params["reranker_backend"],
+        reranker_max_length=rag_params["reranker_max_length"],
+        reranker_type_max_length=rag_params["reranker_type_max_length"],
+        reranker_bucket_size=rag_params["reranker_bucket_size"],
+        reranker_batch_size=rag_params["reranker_batch_size"],
+        reranker_max_wait_ms=rag_params["reranker_max_wait_ms"],
+        reranker_cache_size=rag_params["reranker_cache_size"],
+        reranker_cache_path=rag_params["reranker_cache_path"],
+        reranker_cache_max_entries=rag_params["reranker_cache_max_entries"],
+        reranker_cache_ttl=rag_params["reranker_cache_ttl"],
         num_retrieved = rag_params["num_retrieved"],
+        embedding_cache_size = rag_params["embedding_cache_size"],
+        embedding_cache_ttl = rag_params["embedding_cache_ttl"],
+        translation_cache_size = rag_params["translation_cache_size"],
+        translation_cache_path = rag_params["translation_cache_path"],
+        translation_cache_max_entries = rag_params["translation_cache_max_entries"],
+        translation_cache_ttl = rag_params["translation_cache_ttl"],
+        answer_cache_size = rag_params["answer_cache_size"],
+        answer_cache_threshold = rag_params["answer_cache_threshold"],
+        answer_cache_ttl = rag_params["answer_cache_ttl"],
         reader_prompt = rag_params["reader_prompt"],
         translation_prompt = rag_params["translation_prompt"],
         reader_models = reader_models,
         translation_model = rag_params["translation_model"],
-        ghazal_path = 'data/prepared/ghazal_documents.pkl',
-        masnavi_path = 'data/prepared/masnavi_documents.pkl',
-        programs_path = 'data/prepared/programs_documents.pkl',
+        ghazal_path = 'data/prepared/ghazal_documents.parquet',
+        masnavi_path = 'data/prepared/masnavi_documents.parquet',
+        programs_path = 'data/prepared/programs_documents.parquet',
+        embeddings_path = 'data/prepared/embeddings.parquet',
         dotenv_path = ".env"
     )
 
@@ -69,6 +114,13 @@ async def main() -> None:
         generated_answer = answer['answer'] if 'answer' in answer else ''
         # retrieved_docs = answer['context'] if 'context' in answer else []
 
+        # Whether the document the question was generated from is among the documents given to the reader
+        source = (example["type"], int(example["number"]), int(example["part"]))
+        context_hit = any(
+            (doc.metadata["type"], int(doc.metadata["number"]), int(doc.metadata["part"])) == source
+            for doc in answer.get("context", [])[:5]
+        )
+
         result = {
             "question": question,
             "true_answer": example["answer"],
@@ -76,6 +128,9 @@ async def main() -> None:
             "number": example["number"], 
             "part": example["part"], 
             "generated_answer": generated_answer,
+            "context_hit": context_hit,
+            "num_reranked": answer.get("num_reranked", 0),
+            "rerank_seconds": answer.get("timings", {}).get("rerank", 0.0),
             # "retrieved_docs": retrieved_docs,
         }
         
@@ -103,8 +158,16 @@ async def main() -> None:
     scores = [int(output['eval_score']) for output in outputs]
     mean_judge_scores = np.mean(scores)
 
+    # Quality and cross-encoder cost, to compare fusion methods and fusion_top_n
+    metrics = {
+        "mean_judge_scores": mean_judge_scores,
+        "context_hit_rate": float(np.mean([output["context_hit"] for output in outputs])),
+        "mean_num_reranked": float(np.mean([output["num_reranked"] for output in outputs])),
+        "mean_rerank_seconds": float(np.mean([output["rerank_seconds"] for output in outputs])),
+    }
+
     with open("evaluation/metrics.json", "w") as f:
-        json.dump({"mean_judge_scores": mean_judge_scores}, f)
+        json.dump(metrics, f)
 
     plt.figure(figsize=(3, 3))
     plt.title("Evaluation score distribution")
@@ -1,24 +1,18 @@
 from utils.dump_table import dump_table
-from dotenv import dotenv_values
+import sys
+sys.path.append("../rag")
+from database import Database
 
 def main() -> None:
-    # Load config
-    config = dotenv_values(".env")
+    # Connection settings are read from .env
+    database = Database(dotenv_path=".env")
 
-    pg_user = config["POSTGRES_USER"]
-    pg_password = config["POSTGRES_PASSWORD"]
-    pg_hostname = config["POSTGRES_HOSTNAME"]
-    pg_db = config["POSTGRES_DB"]
-
-    # Dump embedding table
+    # Dump table
     dump_table(
         table_name='masnavi_bakhsh',
-        pg_user=pg_user,
-        pg_password=pg_password,
-        pg_hostname=pg_hostname,
-        pg_db=pg_db,
+        engine=database.sync_engine,
         output_path='data/raw/masnavi_bakhsh.parquet'
     )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
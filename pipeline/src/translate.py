@@ -0,0 +1,63 @@
+import yaml
+import pandas as pd
+import os
+import sys
+from utils.translation import translate_texts, translation_scope
+sys.path.append("../rag")
+from load_model import load_hf_model, configure_torch_threads
+from dotenv import dotenv_values
+
+def main() -> None:
+    # Corpus to translate, one of the corpora of the translation params
+    corpus_name = sys.argv[1]
+
+    config = dotenv_values(".env")
+    hf_token = config["HF_TOKEN"]
+    params = yaml.safe_load(open("params.yaml"))["translation"]
+    translation_model_name = params["translation_model"]
+    translation_prompt = params["translation_prompt"]
+    batch_size = params["batch_size"]
+    corpus = params["corpora"][corpus_name]
+
+    print(f"Read {corpus_name} file...")
+    documents = pd.read_parquet(corpus["input_path"])
+
+    print("Load translation model...")
+    configure_torch_threads(params["torch_num_threads"], params["torch_num_interop_threads"])
+    translation_model = load_hf_model(
+        translation_model_name,
+        token=hf_token,
+        device=params["device"],
+        dtype=params["dtype"],
+    )
+
+    # Text columns of a row are translated together, one per line
+    persian_texts = documents[corpus["text_columns"]].astype(str).agg("\n".join, axis=1).tolist()
+
+    shard_dir = os.path.join(
+        params["shard_dir"],
+        corpus_name,
+        translation_scope(translation_model_name, translation_prompt, corpus["max_new_tokens"]),
+    )
+
+    print(f"Translating {len(documents)} {corpus_name}...")
+    translations = translate_texts(
+        translation_model,
+        persian_texts,
+        prompt=translation_prompt,
+        batch_size=batch_size,
+        max_new_tokens=corpus["max_new_tokens"],
+        shard_dir=shard_dir,
+        desc=f"Translating {corpus_name}",
+    )
+
+    # Verify we got all translations
+    assert len(translations) == len(documents), f"Expected {len(documents)} translations, got {len(translations)}"
+
+    documents['translation'] = translations
+    documents.to_parquet(corpus["output_path"])
+
+    print(f"Translated {len(translations)} {corpus_name}")
+
+if __name__ == "__main__":
+    main()
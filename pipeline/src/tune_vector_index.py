@@ -0,0 +1,149 @@
+from langchain_postgres import PGVectorStore
+from tqdm import tqdm
+import pandas as pd
+import numpy as np
+import asyncio
+import json
+import time
+import yaml
+import sys
+sys.path.append("../rag")
+from load_model import load_embeddings
+from pgvector_index import apply_vector_indexes, vector_query_options, index_config, save_index_config
+from rag import EMBEDDING_QUERY_INSTRUCTION
+from database import Database
+
+# Build parameters, each one is swept with all the search parameters of its index type
+BUILD_GRID = [
+    ("ivfflat", {"lists": 50}),
+    ("ivfflat", {"lists": 100}),
+    ("ivfflat", {"lists": 200}),
+    ("hnsw", {"m": 16, "ef_construction": 64}),
+    ("hnsw", {"m": 16, "ef_construction": 128}),
+    ("hnsw", {"m": 32, "ef_construction": 128}),
+]
+SEARCH_GRID = {
+    "ivfflat": [{"probes": probes} for probes in (1, 5, 10, 20, 40)],
+    "hnsw": [{"ef_search": ef_search} for ef_search in (40, 100, 200, 400)],
+}
+
+async def search(vector_store, query_embeddings, filters, k):
+    results = []
+    latencies = []
+
+    for embedding in query_embeddings:
+        for metadata_filter in filters:
+            start = time.perf_counter()
+            documents = await vector_store.asimilarity_search_with_score_by_vector(embedding, k=k, filter=metadata_filter)
+            latencies.append(time.perf_counter() - start)
+            results.append({doc.id for doc, _ in documents})
+
+    return results, np.array(latencies) * 1000
+
+async def sweep(vector_store, create_vector_store, query_embeddings, filters, table_name, partial_types, k):
+    print("Exact search...")
+    await apply_vector_indexes(vector_store, table_name, "exact", partial_types)
+    exact_results, latencies = await search(vector_store, query_embeddings, filters, k)
+    reports = [{
+        "index_type": "exact",
+        f"recall@{k}": 1.0,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }]
+
+    for index_type, build_params in BUILD_GRID:
+        print(f"Build {index_type} {build_params}...")
+        start = time.perf_counter()
+        await apply_vector_indexes(vector_store, table_name, index_type, partial_types, **build_params)
+        build_seconds = time.perf_counter() - start
+
+        for search_params in tqdm(SEARCH_GRID[index_type]):
+            results, latencies = await search(await create_vector_store(index_type, search_params), query_embeddings, filters, k)
+            recalls = [len(result & exact) / len(exact) for result, exact in zip(results, exact_results) if exact]
+
+            reports.append({
+                "index_type": index_type,
+                **build_params,
+                **search_params,
+                "build_seconds": build_seconds,
+                f"recall@{k}": float(np.mean(recalls)),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+            })
+
+    return reports
+
+async def main() -> None:
+    # Load parameters
+    params = yaml.safe_load(open("params.yaml"))
+    embedding_params = params["create_embeddings"]
+    rag_params = params["rag"]
+    table_name = embedding_params["embedding_table_name"]
+    partial_types = embedding_params["pgvector_partial_types"]
+    k = rag_params["num_retrieved"]
+
+    database = Database(
+        dotenv_path=".env",
+        pool_size=embedding_params["db_pool_size"],
+        max_overflow=embedding_params["db_max_overflow"],
+        pool_timeout=embedding_params["db_pool_timeout"],
+        pool_pre_ping=embedding_params["db_pool_pre_ping"],
+        statement_timeout_ms=embedding_params["db_statement_timeout_ms"],
+        prepare_threshold=embedding_params["db_prepare_threshold"],
+    )
+    engine = database.pg_engine
+
+    print("Embed evaluation questions...")
+    embeddings = load_embeddings(embedding_params["embedding_model"], embedding_params["embedding_size"])
+    questions = pd.read_parquet("data/prepared/evaluation_dataset.parquet")["question"].tolist()
+    query_embeddings = embeddings.embed_documents([f"{EMBEDDING_QUERY_INSTRUCTION}{question}" for question in questions])
+
+    # Unfiltered searches use the global index, single type searches the partial indexes
+    filters = [None] + [{"type": {"$in": [partial_type]}} for partial_type in partial_types]
+
+    async def create_vector_store(index_type, search_params=None):
+        search_params = search_params or {}
+        return await PGVectorStore.create(
+            engine=engine,
+            table_name=table_name,
+            embedding_service=embeddings,
+            metadata_columns=["type", "number", "part", "translation"],
+            index_query_options=vector_query_options(index_type, **search_params),
+        )
+
+    # The sweep replaces the indexes of the live table, create_embeddings rebuilds them
+    # if it is interrupted before the configured index is restored
+    save_index_config(database, table_name, None)
+    vector_store = await create_vector_store("exact")
+
+    try:
+        reports = await sweep(vector_store, create_vector_store, query_embeddings, filters, table_name, partial_types, k)
+    finally:
+        # Leave the table with the configured index
+        config = index_config(
+            embedding_params["pgvector_index_type"],
+            partial_types=partial_types,
+            lists=embedding_params["pgvector_lists"],
+            m=embedding_params["pgvector_m"],
+            ef_construction=embedding_params["pgvector_ef_construction"],
+        )
+        print(f"Restore {config['type']} index...")
+        await apply_vector_indexes(
+            vector_store,
+            table_name,
+            config["type"],
+            partial_types=config["partial_types"],
+            lists=config["lists"],
+            m=config["m"],
+            ef_construction=config["ef_construction"],
+        )
+        save_index_config(database, table_name, config)
+
+    report = pd.DataFrame(reports)
+    print(report.to_string(index=False))
+
+    with open("evaluation/vector_index_tuning.json", "w") as f:
+        json.dump(reports, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,110 @@
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from pgvector.psycopg import register_vector
+import numpy as np
 from tqdm import tqdm
+import hashlib
+import time
+import uuid
+import sys
+sys.path.append("../rag")
+from document_store import DocumentStore
 
-def add_documents_to_vector_store(vector_store, documents, batch_size=100):
-    print("Add them to PGVectorStore...")
-    # Add all documents to pgvector store
-    # Note: we do it by batch to avoid postgres max parameters issues
-    for i in tqdm(range(0, len(documents), batch_size)):
-        batch = documents[i:i + batch_size]
-        vector_store.add_documents(batch)
\ No newline at end of file
+# Columns of the table created by PGEngine.ainit_vectorstore_table and their Postgres types
+COPY_COLUMNS = ["langchain_id", "content", "embedding", "type", "number", "part", "translation", "langchain_metadata"]
+COPY_TYPES = ["uuid", "text", "vector", "varchar", "int4", "int4", "varchar", "json"]
+
+def assign_content_ids(documents, id_scope):
+    """
+    Give each document an id derived from its content and the embedding model (id_scope),
+    the same document keeps the same id across runs. Identical documents are numbered.
+    """
+    occurrences = Counter()
+
+    for doc in documents:
+        key = "\0".join(str(value) for value in (
+            id_scope,
+            doc.metadata["type"],
+            doc.metadata["number"],
+            doc.metadata["part"],
+            doc.page_content,
+            doc.metadata["translation"],
+        ))
+        digest = hashlib.sha256(f"{key}\0{occurrences[key]}".encode("utf-8")).digest()
+        occurrences[key] += 1
+
+        # pgvector rows and the saved documents share the id
+        doc.id = str(uuid.UUID(bytes=digest[:16]))
+        doc.metadata["id"] = doc.id
+
+def copy_documents(database, table_name, documents, embeddings):
+    """
+    Load documents and their embeddings into the langchain_postgres table with a binary COPY.
+    """
+    start = time.perf_counter()
+
+    with database.sync_engine.connect() as conn:
+        connection = conn.connection.driver_connection
+        register_vector(connection)
+
+        with connection.cursor() as cursor:
+            with cursor.copy(f'COPY "{table_name}" ({", ".join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT BINARY)') as copy:
+                copy.set_types(COPY_TYPES)
+
+                for doc, embedding in zip(documents, embeddings):
+                    copy.write_row((
+                        uuid.UUID(doc.id),
+                        doc.page_content,
+                        np.asarray(embedding, dtype=np.float32),
+                        doc.metadata["type"],
+                        int(doc.metadata["number"]),
+                        int(doc.metadata["part"]),
+                        doc.metadata["translation"],
+                        # Metadata outside the metadata columns, as stored by PGVectorStore.add_documents
+                        {"id": doc.id},
+                    ))
+
+        # Each batch is committed, an interrupted run resumes from the ids already in the table
+        connection.commit()
+
+    return time.perf_counter() - start
+
+def ingest_documents(database, table_name, embedding_model, documents, batch_size=1024, queue_size=2):
+    """
+    Embed documents in large batches and COPY them into the embedding table.
+
+    Batches are written by a background thread while the next one is encoded,
+    at most queue_size encoded batches wait for their COPY.
+    """
+    start = time.perf_counter()
+    encode_seconds = 0.0
+    copy_seconds = 0.0
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="copy") as writer:
+        for i in tqdm(range(0, len(documents), batch_size), desc="Ingesting documents"):
+            batch = documents[i:i + batch_size]
+
+            encode_start = time.perf_counter()
+            embeddings = embedding_model.embed_documents([doc.page_content for doc in batch])
+            encode_seconds += time.perf_counter() - encode_start
+
+            while len(pending) >= queue_size:
+                copy_seconds += pending.popleft().result()
+
+            pending.append(writer.submit(copy_documents, database, table_name, batch, embeddings))
+
+        while pending:
+            copy_seconds += pending.popleft().result()
+
+    elapsed = time.perf_counter() - start
+    if documents:
+        print(
+            f"Ingested {len(documents)} documents in {elapsed:.1f}s ({len(documents) / elapsed:.1f} docs/sec), "
+            f"encode: {encode_seconds:.1f}s ({len(documents) / encode_seconds:.1f} docs/sec), "
+            f"copy: {copy_seconds:.1f}s ({len(documents) / copy_seconds:.1f} docs/sec)"
+        )
+
+def save_documents(documents, path):
+    # Columnar layout read by rag/document_store.py
+    DocumentStore.from_documents(documents).write(path)
@@ -1,9 +1,8 @@
-import uuid
 import pandas as pd
-import pickle
+import numpy as np
 from tqdm import tqdm
 from langchain_core.documents import Document
-from utils.common_embeddings import add_documents_to_vector_store
+from utils.common_embeddings import assign_content_ids, save_documents
 
 def process_masnavi_beyt(row_data, row_bakhsh):
     persian_text = f"{row_data['beyt1']}\n{row_data['beyt2']}"
@@ -11,7 +10,6 @@ def process_masnavi_beyt(row_data, row_bakhsh):
     return Document(
         page_content=persian_text,
         metadata={
-            "id": f"M{row_data['book']}_{row_bakhsh['bakhsh']}_{uuid.uuid4().hex[:4]}",
             "type": "masnavi",
             "number": row_data["book"],
             "part": row_bakhsh["bakhsh"],
@@ -19,24 +17,69 @@ def process_masnavi_beyt(row_data, row_bakhsh):
         },
     )
 
+def assign_bakhsh(masnavi, masnavi_bakhsh):
+    """
+    Interval join of the beyts to the bakhsh containing them, in one pass per book.
+
+    Returns the positions of the matched masnavi rows and of their bakhsh rows,
+    ordered by bakhsh and then by masnavi row, like a per-bakhsh filter of the table.
+    """
+    books = masnavi["book"].to_numpy()
+    numbers = masnavi["number"].to_numpy()
+    bakhsh_books = masnavi_bakhsh["book"].to_numpy()
+    first_beyts = masnavi_bakhsh["first_beyt"].to_numpy()
+    last_beyts = masnavi_bakhsh["last_beyt"].to_numpy()
+
+    starts = np.zeros(len(masnavi_bakhsh), dtype=np.int64)
+    ends = np.zeros(len(masnavi_bakhsh), dtype=np.int64)
+
+    # Beyts sorted by book then number, each bakhsh is a contiguous range of this order
+    order = np.lexsort((numbers, books))
+    sorted_books = books[order]
+    sorted_numbers = numbers[order]
+
+    for book in np.unique(bakhsh_books):
+        book_start = np.searchsorted(sorted_books, book, side="left")
+        book_end = np.searchsorted(sorted_books, book, side="right")
+        book_numbers = sorted_numbers[book_start:book_end]
+        rows = np.flatnonzero(bakhsh_books == book)
+
+        starts[rows] = book_start + np.searchsorted(book_numbers, first_beyts[rows], side="left")
+        ends[rows] = book_start + np.searchsorted(book_numbers, last_beyts[rows], side="right")
+
+    lengths = np.maximum(ends - starts, 0)
+    bakhsh_rows = np.repeat(np.arange(len(masnavi_bakhsh)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    beyt_rows = order[np.repeat(starts, lengths) + offsets]
+
+    # Inside a bakhsh, beyts keep the order of the masnavi table
+    result_order = np.lexsort((beyt_rows, bakhsh_rows))
+    return beyt_rows[result_order], bakhsh_rows[result_order]
+
 def create_masnavi_documents(masnavi, masnavi_bakhsh):
-    masnavi_docs = []
-    for _, row_bakhsh in tqdm(masnavi_bakhsh.iterrows(), total=len(masnavi_bakhsh), desc="Creating masnavi documents"):
-        for _, row_data in masnavi.query(
-            'book == @row_bakhsh.book and number >= @row_bakhsh.first_beyt and number <= @row_bakhsh.last_beyt'
-        ).iterrows():
-            masnavi_docs.append(process_masnavi_beyt(row_data, row_bakhsh))
-    return masnavi_docs
-
-def create_embeddings_masnavi(vector_store):
+    beyt_rows, bakhsh_rows = assign_bakhsh(masnavi, masnavi_bakhsh)
+
+    return [
+        process_masnavi_beyt(row_data, row_bakhsh)
+        for row_data, row_bakhsh in tqdm(
+            zip(
+                masnavi.iloc[beyt_rows].to_dict("records"),
+                masnavi_bakhsh.iloc[bakhsh_rows].to_dict("records"),
+            ),
+            total=len(beyt_rows),
+            desc="Creating masnavi documents",
+        )
+    ]
+
+def prepare_masnavi_documents(id_scope):
     print("Reading masnavi files...")
     masnavi = pd.read_parquet("data/raw/masnavi.parquet")
     masnavi_bakhsh = pd.read_parquet("data/raw/masnavi_bakhsh.parquet")
 
     docs = create_masnavi_documents(masnavi, masnavi_bakhsh)
-    
-    print("Adding masnavi documents to vector store...")
-    add_documents_to_vector_store(vector_store, docs, batch_size=256)
 
-    with open('data/prepared/masnavi_documents.pkl', 'wb') as outp:
-        pickle.dump(docs, outp, pickle.HIGHEST_PROTOCOL)
\ No newline at end of file
+    assign_content_ids(docs, id_scope)
+
+    save_documents(docs, 'data/prepared/masnavi_documents.parquet')
+
+    return docs
@@ -1,26 +1,29 @@
-import psycopg2
+from sqlalchemy.exc import SQLAlchemyError
 import pandas as pd
+import uuid
+
+def uuid_columns_to_str(table):
+    # psycopg 3 loads uuid columns as uuid.UUID objects, which pyarrow writes as an
+    # extension type or rejects depending on its version, they are dumped as strings
+    for column in table.columns:
+        values = table[column].dropna()
+        if table[column].dtype == object and len(values) and isinstance(values.iloc[0], uuid.UUID):
+            table[column] = table[column].map(lambda value: None if value is None else str(value))
+
+    return table
 
 def dump_table(
     *,
     table_name: str,
-    pg_user: str,
-    pg_password: str,
-    pg_hostname: str,
-    pg_db: str,
+    engine,
     output_path: str,
 ):
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(host=pg_hostname, database=pg_db, user=pg_user, password=pg_password)
-        cursor = conn.cursor()
-
-        table = pd.read_sql(f"SELECT * FROM {table_name};", conn)
-
-        cursor.close()
-        conn.close()
+        with engine.connect() as conn:
+            table = pd.read_sql(f'SELECT * FROM "{table_name}";', conn)
 
-    except psycopg2.Error as e:
+    except SQLAlchemyError as e:
         print(f"Error connecting to PostgreSQL: {e}")
+        raise
 
-    table.to_parquet(output_path)
\ No newline at end of file
+    uuid_columns_to_str(table).to_parquet(output_path)
@@ -0,0 +1,102 @@
+from tqdm import tqdm
+import pandas as pd
+import hashlib
+import time
+import glob
+import os
+
+def format_prompt(instruction, context):
+    return [
+        {
+            "role": "system",
+            "content": [{"type": "text", "text": instruction}]
+        },
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": context}
+            ]
+        }
+    ]
+
+def source_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def translation_scope(model_name, prompt, max_new_tokens):
+    # Shards of another model, prompt or generation length are never reused
+    scope = f"{model_name}\n{prompt}\n{max_new_tokens}"
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest()[:16]
+
+def read_shards(shard_dir):
+    """
+    Translations of the completed batches, by source text hash.
+    """
+    paths = sorted(glob.glob(os.path.join(shard_dir, "shard-*.parquet")))
+
+    if not paths:
+        return {}, 0
+
+    shards = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+    return dict(zip(shards["source_hash"], shards["translation"])), len(paths)
+
+def write_shard(shard_dir, shard_number, hashes, translations):
+    # Written next to its final name then renamed, an interrupted write leaves no partial shard
+    path = os.path.join(shard_dir, f"shard-{shard_number:06d}.parquet")
+    pd.DataFrame({"source_hash": hashes, "translation": translations}).to_parquet(f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+def translate_texts(translation_model, texts, prompt, batch_size, max_new_tokens, shard_dir, desc="Translating"):
+    """
+    Translate texts with a HF image-text-to-text pipeline and return the translations in input order.
+
+    Texts whose hash already has a translation in shard_dir are skipped, the
+    others are translated once per distinct text, longest first, in batches of
+    similar token length. Every batch is saved as a parquet shard so an
+    interrupted run resumes from the completed batches.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    hashes = [source_hash(text) for text in texts]
+    translations, num_shards = read_shards(shard_dir)
+
+    pending = {}
+    for text_hash, text in zip(hashes, texts):
+        if text_hash not in translations:
+            pending.setdefault(text_hash, text)
+
+    print(f"{len(texts) - sum(text_hash in pending for text_hash in hashes)}/{len(texts)} texts already translated in {num_shards} shards")
+
+    if pending:
+        # Batches of similar length waste less compute on padding
+        tokenizer = translation_model.tokenizer or translation_model.processor.tokenizer
+        pending_hashes = list(pending)
+        num_tokens = [
+            len(input_ids)
+            for input_ids in tokenizer(list(pending.values()), add_special_tokens=False)["input_ids"]
+        ]
+        pending_hashes = [text_hash for _, text_hash in sorted(zip(num_tokens, pending_hashes), key=lambda x: -x[0])]
+
+        start_time = time.perf_counter()
+        num_batches = (len(pending_hashes) + batch_size - 1) // batch_size
+
+        for batch_number, i in enumerate(tqdm(range(0, len(pending_hashes), batch_size), total=num_batches, desc=desc)):
+            batch_hashes = pending_hashes[i:i+batch_size]
+            batch_prompts = [
+                format_prompt(prompt, f"{pending[text_hash]}\nTranslation:")
+                for text_hash in batch_hashes
+            ]
+
+            batch_results = translation_model(
+                text=batch_prompts,
+                max_new_tokens=max_new_tokens,
+                temperature=0,
+                batch_size=len(batch_prompts),
+            )
+
+            batch_translations = [result[0]["generated_text"][-1]["content"].strip() for result in batch_results]
+            write_shard(shard_dir, num_shards + batch_number, batch_hashes, batch_translations)
+            translations.update(zip(batch_hashes, batch_translations))
+
+        elapsed = time.perf_counter() - start_time
+        print(f"Translated {len(pending_hashes)} texts in {elapsed:.1f}s ({len(pending_hashes) / elapsed:.2f} texts/sec)")
+
+    return [translations[text_hash] for text_hash in hashes]
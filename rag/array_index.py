@@ -0,0 +1,82 @@
+import numpy as np
+import json
+import os
+
+class ArrayIndex:
+    """
+    Index made of numpy arrays saved as .npy files next to a header.json,
+    loaded memory-mapped and only reused when its header matches.
+
+    Subclasses list the names of their arrays in _arrays, which are also the
+    keyword arguments of their constructor.
+    """
+
+    _arrays = []
+    _description = "Index"
+
+    def save(self, path, header):
+        os.makedirs(path, exist_ok=True)
+
+        # Files are replaced, never rewritten in place, so workers that
+        # already memory-mapped the previous index keep valid pages
+        for name in self._arrays:
+            tmp_path = os.path.join(path, f"{name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                np.save(f, getattr(self, name))
+            os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+        # The header is written last, an index without a matching header is rebuilt
+        tmp_path = os.path.join(path, f"header.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, os.path.join(path, "header.json"))
+
+    @classmethod
+    def load(cls, path, header):
+        """
+        Memory-map a saved index, returns None if it is missing or was saved with another header.
+        """
+        try:
+            with open(os.path.join(path, "header.json")) as f:
+                saved_header = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        if saved_header != header:
+            print(f"{cls._description} {path} is stale (saved: {saved_header}, expected: {header})")
+            return None
+
+        return cls(**{
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+            for name in cls._arrays
+        })
+
+    @staticmethod
+    def top_k(scores, limit: int):
+        """
+        Positions of the limit highest scores, highest first.
+        """
+        limit = min(limit, len(scores))
+
+        if limit <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        candidates = np.argpartition(scores, -limit)[-limit:]
+        return candidates[np.argsort(scores[candidates])[::-1]]
+
+def type_document_ids(documents):
+    # Document ids of each type of a DocumentStore, used to filter before taking the top-k
+    return {
+        document_type: documents.type_ids(document_type)
+        for document_type in documents.type_names
+    }
+
+def candidate_ids(type_document_ids, types):
+    """
+    Sorted ids of the documents of any of the types.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate([empty] + [
+        type_document_ids.get(document_type, empty)
+        for document_type in types
+    ]))
@@ -1,11 +1,15 @@
-from rank_bm25 import BM25Okapi
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import hashlib
 from shekar import Normalizer, Lemmatizer, WordTokenizer
 from shekar.preprocessing import (
   PunctuationRemover,
   NonPersianRemover,
   DiacriticRemover,
 )
-import pickle
+from document_store import DocumentStore
+from array_index import ArrayIndex, type_document_ids, candidate_ids
 import numpy as np
 
 # Module-level instances (created once)
@@ -14,57 +18,212 @@ _lemmatizer = Lemmatizer()
 _wordTokenizer = WordTokenizer()
 _clean_text = NonPersianRemover() | DiacriticRemover() | PunctuationRemover()
 
+# Hits and misses of the lemma caches of process pool workers
+_worker_cache_stats = {"hits": 0, "misses": 0}
+
+@lru_cache(maxsize=100_000)
+def _lemmatize(token):
+    # The vocabulary of the corpus is small and repetitive, most tokens are already known
+    return _lemmatizer(token)
+
 def preprocess_persian(text):
     text = _clean_text(text)
     text = _normalizer(text)
     tokens = _wordTokenizer(text)
-    tokens = [_lemmatizer(token) for token in list(tokens)]
+    tokens = [_lemmatize(token) for token in list(tokens)]
     return tokens
 
+def _preprocess_persian_chunk(texts):
+    before = _lemmatize.cache_info()
+    tokens = [preprocess_persian(text) for text in texts]
+    after = _lemmatize.cache_info()
+    return tokens, after.hits - before.hits, after.misses - before.misses
+
+def preprocess_persian_batch(texts, num_workers=1, chunk_size=512):
+    texts = [str(text) for text in texts]
+
+    if num_workers <= 1 or len(texts) <= chunk_size:
+        return [preprocess_persian(text) for text in texts]
+
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    preprocessed_texts = []
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        for tokens, hits, misses in executor.map(_preprocess_persian_chunk, chunks):
+            preprocessed_texts.extend(tokens)
+            _worker_cache_stats["hits"] += hits
+            _worker_cache_stats["misses"] += misses
+
+    return preprocessed_texts
+
+def lemma_cache_stats():
+    info = _lemmatize.cache_info()
+    hits = info.hits + _worker_cache_stats["hits"]
+    misses = info.misses + _worker_cache_stats["misses"]
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
+
+BM25_INDEX_VERSION = 1
+
+def corpus_hash(texts):
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(str(text).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class BM25Index(ArrayIndex):
+    """
+    Okapi BM25 scores stored as a CSR term-document weight matrix.
+
+    Each row holds the final BM25 contribution of one term to every document
+    containing it, with idf, k1 and b already applied, so scoring a query is a
+    gather of its rows followed by a sum. Scores match rank_bm25.BM25Okapi.
+    """
+
+    _arrays = ["vocabulary", "indptr", "indices", "weights", "document_lengths"]
+    _description = "BM25 index"
+
+    def __init__(self, vocabulary, indptr, indices, weights, document_lengths):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.document_lengths = document_lengths
+        self.num_documents = len(document_lengths)
+
+    @classmethod
+    def build(cls, corpus, k1, b, epsilon=0.25):
+        vocabulary = {}
+        term_ids = []
+        doc_ids = []
+        frequencies = []
+        doc_len = np.zeros(len(corpus), dtype=np.float64)
+
+        for doc_id, tokens in enumerate(corpus):
+            doc_len[doc_id] = len(tokens)
+            for token, frequency in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                doc_ids.append(doc_id)
+                frequencies.append(frequency)
+
+        # Terms are sorted so they can be looked up with a binary search in the saved array
+        terms = np.asarray(list(vocabulary), dtype=str)
+        term_order = np.argsort(terms)
+        term_rank = np.empty_like(term_order)
+        term_rank[term_order] = np.arange(len(terms))
+
+        term_ids = term_rank[np.asarray(term_ids, dtype=np.int64)]
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        num_documents = len(corpus)
+        avgdl = doc_len.sum() / num_documents
+
+        # Same idf as BM25Okapi: negative idfs are floored to epsilon * mean idf
+        doc_freqs = np.bincount(term_ids, minlength=len(terms))
+        idf = np.log(num_documents - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        idf[idf < 0] = epsilon * idf.mean()
+
+        length_norm = k1 * (1 - b + b * doc_len[doc_ids] / avgdl)
+        weights = idf[term_ids] * frequencies * (k1 + 1) / (frequencies + length_norm)
+
+        # Group postings by term (rows), documents ascending inside each row
+        order = np.lexsort((doc_ids, term_ids))
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(doc_freqs, out=indptr[1:])
+
+        return cls(
+            vocabulary=terms[term_order],
+            indptr=indptr,
+            indices=doc_ids[order],
+            weights=weights[order].astype(np.float32),
+            document_lengths=doc_len.astype(np.int32),
+        )
+
+    def get_scores(self, query: list[str]):
+        if not query:
+            return np.zeros(self.num_documents)
+
+        # Repeated query tokens are counted as many times as they appear, like BM25Okapi
+        tokens = np.asarray(query, dtype=str)
+        rows = np.searchsorted(self.vocabulary, tokens)
+        found = rows < len(self.vocabulary)
+        found[found] = self.vocabulary[rows[found]] == tokens[found]
+        rows = rows[found]
+
+        if not len(rows):
+            return np.zeros(self.num_documents)
+
+        postings = [slice(self.indptr[row], self.indptr[row + 1]) for row in rows]
+        indices = np.concatenate([self.indices[posting] for posting in postings])
+        weights = np.concatenate([self.weights[posting] for posting in postings])
+
+        return np.bincount(indices, weights=weights, minlength=self.num_documents)
+
 class BM25:
     def __init__(self):
-        self.documents = []
-
-    def create(self, documents_paths, index_name, k1, b):
-        index_path = f'data/{index_name}_bm25_retriever.pkl'
-        
-        try:
-            with open(index_path, 'rb') as f:
-                print(f"Loading pre-computed BM25 from {index_path}...")
-                self.retriever = pickle.load(f)
-
-            for path in documents_paths:
-                with open(path, 'rb') as f:
-                    self.documents.extend(pickle.load(f))
-
-        except FileNotFoundError:
-            for path in documents_paths:
-                with open(path, 'rb') as f:
-                    self.documents.extend(pickle.load(f))
-            
+        self.documents = None
+        self.type_document_ids = {}
+
+    def create(self, documents_paths, index_name, k1, b, num_workers=1):
+        index_path = f'data/{index_name}_bm25'
+
+        # Documents stay as columns, Document objects are only built for retrieved rows
+        self.documents = DocumentStore.read(documents_paths)
+        texts = self.documents.texts()
+
+        # An index saved for other documents or parameters is rebuilt
+        header = {
+            "version": BM25_INDEX_VERSION,
+            "corpus_hash": corpus_hash(texts),
+            "k1": k1,
+            "b": b,
+        }
+
+        print(f"Loading pre-computed BM25 from {index_path}...")
+        self.retriever = BM25Index.load(index_path, header)
+
+        if self.retriever is None:
             print(f"Creating BM25 retriever for {index_name}...")
 
-            preprocessed_documents = [
-                preprocess_persian(str(doc.page_content))
-                for doc in self.documents
-            ]
-                
-            self.retriever = BM25Okapi(preprocessed_documents, b=b, k1=k1)
+            preprocessed_documents = preprocess_persian_batch(texts, num_workers=num_workers)
+            print(f"Lemma cache: {lemma_cache_stats()}")
 
-            # Save the entire retriever
-            with open(index_path, 'wb') as f:
-                pickle.dump(self.retriever, f)
+            self.retriever = BM25Index.build(preprocessed_documents, k1=k1, b=b)
+            self.retriever.save(index_path, header)
 
             print(f"Saved bm25 retriever: {index_path}")
 
+        self.type_document_ids = type_document_ids(self.documents)
+
         return self
 
-    def retrieve(self, query: list[str], limit: int, threshold: float):
+    def retrieve(self, query: list[str], limit: int, threshold: float, types: list[str] | None = None):
+        return [doc for doc, _ in self.retrieve_with_scores(query, limit, threshold, types)]
+
+    def retrieve_with_scores(self, query: list[str], limit: int, threshold: float, types: list[str] | None = None):
+        # IDF and average document length stay computed over the whole corpus,
+        # only the documents considered for the top-k are restricted to the types
         scores = self.retriever.get_scores(query)
-        sorted_scores_indices = np.argsort(scores)[::-1][:limit]
-        sorted_scores = np.asarray(scores)[sorted_scores_indices]
-        
+
+        if types is None:
+            sorted_scores_indices = self.retriever.top_k(scores, limit)
+        else:
+            type_ids = candidate_ids(self.type_document_ids, types)
+            sorted_scores_indices = type_ids[self.retriever.top_k(scores[type_ids], limit)]
+
+        sorted_scores = scores[sorted_scores_indices]
+
         high_scores = sorted_scores > threshold
 
         print(sorted_scores[high_scores])
-        return np.asarray(self.documents)[sorted_scores_indices][high_scores]
+        return list(zip(
+            self.documents.take(sorted_scores_indices[high_scores]),
+            sorted_scores[high_scores].tolist(),
+        ))
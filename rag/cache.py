@@ -0,0 +1,260 @@
+from collections import OrderedDict
+import unicodedata
+import threading
+import sqlite3
+import json
+import time
+import numpy as np
+
+def normalize_question(question):
+    return " ".join(unicodedata.normalize("NFKC", question).split())
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live and hit/miss counters.
+    """
+
+    def __init__(self, max_size: int, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+class SQLiteCache:
+    """
+    Persistent key-value cache stored in a SQLite table, values are stored as JSON.
+
+    Like LRUCache, entries expire ttl seconds after they were written and the
+    table is pruned to the max_entries most recently written entries.
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_entries: int | None = None, ttl: float | None = None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_created ON {table} (created)")
+        self._connection.commit()
+        # Rows at the last prune plus the rows written since, an upper bound of the table size
+        self._size = self._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        self._prune()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            row = self._connection.execute(f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)).fetchone()
+
+            if row is not None and self.ttl is not None and time.time() - row[1] > self.ttl:
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        # One transaction for all the items instead of one commit per item
+        with self._lock:
+            created = time.time()
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), created) for key, value in items],
+            )
+            self._size += len(items)
+
+            if self.max_entries is not None and self._size > self.max_entries:
+                self._prune_locked()
+
+            self._connection.commit()
+
+    def _prune(self):
+        with self._lock:
+            self._prune_locked()
+            self._connection.commit()
+
+    def _prune_locked(self):
+        if self.ttl is not None:
+            self._connection.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,))
+
+        if self.max_entries is not None:
+            # The oldest writes are evicted first
+            self._connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+        self._size = self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "path": self.path,
+        }
+
+class TieredCache:
+    """
+    In-memory LRU cache in front of an optional persistent cache.
+    """
+
+    def __init__(self, memory: LRUCache, disk: SQLiteCache | None = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+
+            if value is not None:
+                self.memory.put(key, value)
+
+        return default if value is None else value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def put_many(self, items):
+        for key, value in items:
+            self.memory.put(key, value)
+
+        if self.disk is not None:
+            self.disk.put_many(items)
+
+    def stats(self):
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+class SemanticCache:
+    """
+    Cache keyed by normalized embeddings: a lookup returns the value of the most
+    similar entry of the same scope if their cosine similarity reaches the threshold.
+
+    Entries expire after ttl seconds and the least recently used one is evicted
+    when the cache is full, like LRUCache.
+    """
+
+    def __init__(self, max_size: int, threshold: float, ttl: float | None = None):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._next_key = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scope: str, embedding, default=None):
+        with self._lock:
+            if self.ttl is not None:
+                now = time.monotonic()
+                expired = [key for key, entry in self._entries.items() if now - entry[3] > self.ttl]
+                for key in expired:
+                    del self._entries[key]
+
+            keys = [key for key, entry in self._entries.items() if entry[0] == scope]
+
+            if keys:
+                similarities = np.stack([self._entries[key][1] for key in keys]) @ np.asarray(embedding, dtype=np.float32)
+                best = int(np.argmax(similarities))
+
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return self._entries[keys[best]][2]
+
+            self.misses += 1
+            return default
+
+    def put(self, scope: str, embedding, value):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[self._next_key] = (scope, np.asarray(embedding, dtype=np.float32), value, time.monotonic())
+            self._next_key += 1
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+        }
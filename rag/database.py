@@ -0,0 +1,133 @@
+from concurrent.futures import Future
+from dotenv import dotenv_values
+from langchain_postgres import PGEngine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from threading import Thread
+import asyncio
+import time
+
+def connection_string(dotenv_path=".env"):
+    config = dotenv_values(dotenv_path)
+    return (
+        f"postgresql+psycopg://{config['POSTGRES_USER']}:{config['POSTGRES_PASSWORD']}"
+        f"@{config['POSTGRES_HOSTNAME']}/{config['POSTGRES_DB']}"
+    )
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """
+    Connection pool counting checkouts and the time spent waiting for a free connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+class Database:
+    """
+    Pooled connections to the Postgres database configured in the .env file.
+
+    The async engine runs on its own event loop thread, like PGEngine.from_connection_string,
+    so the vector store can be used from sync and async code.
+    """
+
+    def __init__(
+        self,
+        dotenv_path=".env",
+        pool_size=5,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_pre_ping=True,
+        statement_timeout_ms=None,
+        prepare_threshold=5,
+    ):
+        self.url = connection_string(dotenv_path)
+        self.pool_size = pool_size
+
+        # psycopg prepares a statement after it ran prepare_threshold times on a connection.
+        # Prepared statements are still planned on every run: a generic plan can't prove that
+        # type = ANY($1) matches a partial per-type vector index and falls back to the global one
+        options = ["-c plan_cache_mode=force_custom_plan"]
+
+        if statement_timeout_ms:
+            options.append(f"-c statement_timeout={int(statement_timeout_ms)}")
+
+        connect_args = {"prepare_threshold": prepare_threshold, "options": " ".join(options)}
+
+        self.engine_kwargs = {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": pool_timeout,
+            "pool_pre_ping": pool_pre_ping,
+            "connect_args": connect_args,
+        }
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, name="postgres", daemon=True)
+        self.thread.start()
+
+        self.async_engine = create_async_engine(self.url, poolclass=TimedAsyncQueuePool, **self.engine_kwargs)
+        self.pg_engine = PGEngine.from_engine(self.async_engine, loop=self.loop)
+        self._sync_engine = None
+
+    @property
+    def sync_engine(self):
+        # Blocking engine for pandas and scripts, created on first use
+        if self._sync_engine is None:
+            self._sync_engine = create_engine(self.url, **self.engine_kwargs)
+
+        return self._sync_engine
+
+    def _run(self, coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def _open_connections(self, num_connections):
+        connections = await asyncio.gather(*[self.async_engine.connect() for _ in range(num_connections)])
+
+        for connection in connections:
+            await connection.execute(text("SELECT 1"))
+
+        # Closed connections go back to the pool and stay open
+        for connection in connections:
+            await connection.close()
+
+    async def warm_up(self, num_connections=None):
+        """
+        Open the pool connections before the first query instead of during it.
+        """
+        num_connections = num_connections or self.pool_size
+        start = time.perf_counter()
+        await asyncio.wrap_future(self._run(self._open_connections(num_connections)))
+        print(f"Opened {num_connections} Postgres connections in {time.perf_counter() - start:.3f}s")
+
+    def stats(self):
+        pool = self.async_engine.pool
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "checkouts": pool.checkouts,
+            "mean_wait_ms": pool.wait_seconds / pool.checkouts * 1000 if pool.checkouts else 0.0,
+            "max_wait_ms": pool.max_wait_seconds * 1000,
+        }
+
+    async def close(self):
+        await asyncio.wrap_future(self._run(self.async_engine.dispose()))
+
+        if self._sync_engine is not None:
+            self._sync_engine.dispose()
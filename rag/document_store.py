@@ -0,0 +1,83 @@
+from langchain_core.documents import Document
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import numpy as np
+
+DOCUMENT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("type", pa.string()),
+    ("number", pa.int64()),
+    ("part", pa.int64()),
+    ("page_content", pa.string()),
+    ("translation", pa.string()),
+])
+
+class DocumentStore:
+    """
+    Documents stored as Arrow columns (id, type, number, part, page_content,
+    translation) addressable by row id.
+
+    Slices share the Arrow buffers of the store, and Document objects are only
+    created for the rows that are asked for.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def read(cls, paths):
+        tables = [
+            pq.read_table(path, memory_map=True).select(DOCUMENT_SCHEMA.names).cast(DOCUMENT_SCHEMA)
+            for path in paths
+        ]
+        return cls(pa.concat_tables(tables))
+
+    @classmethod
+    def from_documents(cls, documents):
+        return cls(pa.Table.from_pylist(
+            [
+                {
+                    "id": str(doc.metadata.get("id", "")),
+                    "type": doc.metadata["type"],
+                    "number": int(doc.metadata["number"]),
+                    "part": int(doc.metadata["part"]),
+                    "page_content": str(doc.page_content),
+                    "translation": str(doc.metadata.get("translation", "")),
+                }
+                for doc in documents
+            ],
+            schema=DOCUMENT_SCHEMA,
+        ))
+
+    def write(self, path):
+        pq.write_table(self.table, path)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, row):
+        return self.take([row])[0]
+
+    def slice(self, start, length=None):
+        return DocumentStore(self.table.slice(start, length))
+
+    def take(self, rows):
+        return [
+            Document(
+                page_content=record.pop("page_content"),
+                metadata=record,
+            )
+            for record in self.table.take(pa.array(rows, type=pa.int64())).to_pylist()
+        ]
+
+    def texts(self):
+        return self.table.column("page_content").to_pylist()
+
+    @property
+    def type_names(self):
+        return pc.unique(self.table.column("type")).to_pylist()
+
+    def type_ids(self, document_type):
+        mask = pc.equal(self.table.column("type"), document_type)
+        return np.flatnonzero(mask.to_numpy(zero_copy_only=False))
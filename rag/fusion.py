@@ -0,0 +1,60 @@
+FUSION_METHODS = ("none", "rrf", "weighted")
+
+def document_key(doc):
+    # BM25 documents carry their id in the metadata, vector store documents in Document.id
+    return doc.metadata.get("id") or doc.id or doc.page_content
+
+def reciprocal_rank_fusion(ranked_results, weights, k=60):
+    """
+    Score each document by the weighted sum of 1 / (k + rank) over the retrievers that returned it.
+    """
+    fused = {}
+
+    for name, results in ranked_results.items():
+        for rank, (doc, _) in enumerate(results, start=1):
+            key = document_key(doc)
+            _, fused_score = fused.get(key, (doc, 0.0))
+            fused[key] = (doc, fused_score + weights.get(name, 1.0) / (k + rank))
+
+    return fused
+
+def normalized_score_fusion(ranked_results, weights):
+    """
+    Min-max normalize the scores of each retriever and score each document by their weighted sum.
+    BM25 scores are unbounded while cosine similarities are not, so raw scores can't be added.
+    """
+    fused = {}
+
+    for name, results in ranked_results.items():
+        if not results:
+            continue
+
+        scores = [score for _, score in results]
+        low, high = min(scores), max(scores)
+
+        for doc, score in results:
+            normalized_score = (score - low) / (high - low) if high > low else 1.0
+            key = document_key(doc)
+            _, fused_score = fused.get(key, (doc, 0.0))
+            fused[key] = (doc, fused_score + weights.get(name, 1.0) * normalized_score)
+
+    return fused
+
+def fuse(ranked_results, method, weights, limit, rrf_k=60):
+    """
+    Merge the (document, score) lists of several retrievers, deduplicated by document id,
+    and keep the limit best documents for the reranker.
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method {method}, expected one of {FUSION_METHODS}")
+
+    if method == "none":
+        return [doc for results in ranked_results.values() for doc, _ in results]
+
+    if method == "rrf":
+        fused = reciprocal_rank_fusion(ranked_results, weights, k=rrf_k)
+    else:
+        fused = normalized_score_fusion(ranked_results, weights)
+
+    ranked = sorted(fused.values(), key=lambda item: item[1], reverse=True)
+    return [doc for doc, _ in ranked[:limit]]
@@ -1,17 +1,181 @@
 from langchain_ollama import ChatOllama
+from langchain_huggingface import HuggingFaceEmbeddings
+from sentence_transformers import CrossEncoder, SentenceTransformer, export_dynamic_quantized_onnx_model
 from transformers import pipeline
 import torch
+import os
+
+INFERENCE_BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+INFERENCE_DEVICES = ("auto", "cuda", "mps", "cpu")
+INFERENCE_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+# avx2 kernels run on every x86-64 CPU we deploy to, avx512_vnni is faster where available
+ONNX_QUANTIZATION = "avx2"
+# CPU flags of native bfloat16 matmuls, without them bfloat16 is emulated and slower than float32
+CPU_BF16_FLAGS = ("amx_bf16", "avx512_bf16")
 
 def load_llm(name, translation=False):
     temperature = 0 if translation else 0.2
     return ChatOllama(model=name, temperature=temperature, num_predict=512)
     
-def load_hf_model(name, token):
+def cpu_supports_bf16():
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            flags = set(cpuinfo.read().split())
+    except OSError:
+        return False
+
+    return any(flag in flags for flag in CPU_BF16_FLAGS)
+
+def resolve_device(device="auto"):
+    if device not in INFERENCE_DEVICES:
+        raise ValueError(f"Unknown inference device {device}, expected one of {INFERENCE_DEVICES}")
+
+    if device != "auto":
+        return device
+
+    if torch.cuda.is_available():
+        return "cuda"
+
+    if torch.backends.mps.is_available():
+        return "mps"
+
+    return "cpu"
+
+def resolve_dtype(device, dtype="auto"):
+    """
+    Torch dtype of the weights on a resolved device, "auto" picks bfloat16 on
+    GPUs and on CPUs with native bfloat16 kernels, float32 otherwise.
+    """
+    if dtype != "auto":
+        if dtype not in INFERENCE_DTYPES:
+            raise ValueError(f"Unknown inference dtype {dtype}, expected auto or one of {tuple(INFERENCE_DTYPES)}")
+        return INFERENCE_DTYPES[dtype]
+
+    if device == "cuda":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+    if device == "mps" or cpu_supports_bf16():
+        return torch.bfloat16
+
+    return torch.float32
+
+def inference_precision(backend="torch", device="auto", dtype="auto"):
+    # Quantized and ONNX backends target float32 CPU inference
+    if backend != "torch":
+        return "cpu", torch.float32
+
+    device = resolve_device(device)
+    return device, resolve_dtype(device, dtype)
+
+def inference_scope(backend="torch", device="auto", dtype="auto"):
+    """
+    Backend, resolved device and dtype of a model, outputs computed under another scope may differ.
+    """
+    device, torch_dtype = inference_precision(backend, device, dtype)
+    return f"{backend}:{device}:{str(torch_dtype).removeprefix('torch.')}"
+
+def resolve_inference(name, backend="torch", device="auto", dtype="auto"):
+    device, torch_dtype = inference_precision(backend, device, dtype)
+    print(f"Load {name} with the {backend} backend on {device} ({str(torch_dtype).removeprefix('torch.')})")
+    return device, torch_dtype
+
+def configure_torch_threads(num_threads=None, num_interop_threads=None):
+    """
+    Set the torch intra-op and inter-op thread pools, None keeps the torch default.
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    if num_interop_threads is not None:
+        try:
+            torch.set_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work started
+            print(f"Torch inter-op threads already started, keep {torch.get_num_interop_threads()}")
+
+    print(f"Torch threads: {torch.get_num_threads()} intra-op, {torch.get_num_interop_threads()} inter-op")
+
+def load_hf_model(name, token, device="auto", dtype="auto"):
+    device, torch_dtype = resolve_inference(name, device=device, dtype=dtype)
+
     return pipeline(
         "image-text-to-text",
         model=name,
-        device="mps",
-        torch_dtype=torch.bfloat16,
+        device=device,
+        torch_dtype=torch_dtype,
         token=token,
         tokenizer_kwargs={"use_fast": True},
-    )
\ No newline at end of file
+    )
+
+def check_inference_backend(backend):
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend}, expected one of {INFERENCE_BACKENDS}")
+
+def quantize_linear_layers(model):
+    # Dynamic quantization stores Linear weights in int8 and quantizes activations on the fly, CPU only
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def export_onnx_int8(model_class, name, export_dir="data/onnx", **kwargs):
+    """
+    Export a sentence-transformers model to ONNX and quantize it to int8 once,
+    returns the local model path and the name of the quantized ONNX file.
+    """
+    path = os.path.join(export_dir, name.replace("/", "--"))
+    file_name = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+
+    if not os.path.exists(os.path.join(path, file_name)):
+        print(f"Export {name} to {path}/{file_name}...")
+        model = model_class(name, backend="onnx", **kwargs)
+        model.save_pretrained(path)
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, path)
+
+    return path, file_name
+
+def load_cross_encoder(name, backend="torch", device="auto", dtype="auto", **kwargs):
+    check_inference_backend(backend)
+    kwargs["device"], torch_dtype = resolve_inference(name, backend=backend, device=device, dtype=dtype)
+
+    if backend == "torch":
+        return CrossEncoder(name, model_kwargs={"torch_dtype": torch_dtype}, **kwargs)
+
+    if backend == "torch_int8":
+        return quantize_linear_layers(CrossEncoder(name, **kwargs))
+
+    if backend == "onnx":
+        return CrossEncoder(name, backend="onnx", **kwargs)
+
+    path, file_name = export_onnx_int8(CrossEncoder, name, **kwargs)
+    return CrossEncoder(path, backend="onnx", model_kwargs={"file_name": file_name}, **kwargs)
+
+def load_embeddings(name, embedding_size, backend="torch", device="auto", dtype="auto", batch_size=32, token=None):
+    check_inference_backend(backend)
+    model_kwargs = {"token": token}
+    model_kwargs["device"], torch_dtype = resolve_inference(name, backend=backend, device=device, dtype=dtype)
+
+    if backend == "torch":
+        model_kwargs["model_kwargs"] = {"torch_dtype": torch_dtype}
+    elif backend == "onnx":
+        model_kwargs["backend"] = "onnx"
+    elif backend == "onnx_int8":
+        name, file_name = export_onnx_int8(SentenceTransformer, name, device="cpu")
+        model_kwargs["backend"] = "onnx"
+        model_kwargs["model_kwargs"] = {"file_name": file_name}
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=name,
+        model_kwargs=model_kwargs,
+        encode_kwargs={
+            "normalize_embeddings": True,
+            "truncate_dim": embedding_size,
+            "batch_size": batch_size,
+        },
+    )
+
+    if backend == "torch_int8":
+        quantize_linear_layers(embeddings._client)
+
+    return embeddings
@@ -0,0 +1,100 @@
+from langchain_postgres.v2.indexes import (
+    ExactNearestNeighbor,
+    HNSWIndex,
+    HNSWQueryOptions,
+    IVFFlatIndex,
+    IVFFlatQueryOptions,
+)
+from sqlalchemy import text
+import json
+import re
+
+PGVECTOR_INDEX_TYPES = ("exact", "ivfflat", "hnsw")
+
+def _check_index_type(index_type):
+    if index_type not in PGVECTOR_INDEX_TYPES:
+        raise ValueError(f"Unknown pgvector index type {index_type}, expected one of {PGVECTOR_INDEX_TYPES}")
+
+def vector_index(index_type, lists=100, m=16, ef_construction=64, name=None, partial_type=None):
+    """
+    Build parameters of a pgvector index, optionally restricted to the rows of one document type.
+    """
+    _check_index_type(index_type)
+
+    # The type ends up in the CREATE INDEX statement, only plain names are allowed
+    if partial_type is not None and not re.fullmatch(r"\w+", partial_type):
+        raise ValueError(f"Invalid document type for a partial index: {partial_type}")
+
+    partial_indexes = f"type = '{partial_type}'" if partial_type is not None else None
+
+    if index_type == "ivfflat":
+        return IVFFlatIndex(name=name, lists=lists, partial_indexes=partial_indexes)
+    if index_type == "hnsw":
+        return HNSWIndex(name=name, m=m, ef_construction=ef_construction, partial_indexes=partial_indexes)
+    return ExactNearestNeighbor(name=name)
+
+def vector_query_options(index_type, probes=1, ef_search=40):
+    """
+    Search parameters set with SET LOCAL before each similarity search.
+    """
+    _check_index_type(index_type)
+
+    if index_type == "ivfflat":
+        return IVFFlatQueryOptions(probes=probes)
+    if index_type == "hnsw":
+        return HNSWQueryOptions(ef_search=ef_search)
+    return None
+
+async def apply_vector_indexes(vector_store, table_name, index_type, partial_types=(), **build_params):
+    """
+    Replace the vector indexes of a table by one index over all rows and one partial index per type.
+
+    A search filtered on a single type can use the partial index of that type instead of
+    walking the global index and discarding the rows of other types.
+    """
+    # The global index keeps the default langchain_postgres name
+    names = [None] + [f"{table_name}_{partial_type}_index" for partial_type in partial_types]
+
+    for name in names:
+        await vector_store.adrop_vector_index(name)
+
+    if index_type == "exact":
+        return
+
+    await vector_store.aapply_vector_index(vector_index(index_type, name=names[0], **build_params))
+
+    for name, partial_type in zip(names[1:], partial_types):
+        await vector_store.aapply_vector_index(
+            vector_index(index_type, name=name, partial_type=partial_type, **build_params)
+        )
+
+def index_config(index_type, partial_types=(), lists=100, m=16, ef_construction=64):
+    """
+    Build configuration of the vector indexes of a table, as stored by save_index_config.
+    """
+    _check_index_type(index_type)
+    return {
+        "type": index_type,
+        "partial_types": list(partial_types),
+        "lists": lists,
+        "m": m,
+        "ef_construction": ef_construction,
+    }
+
+def saved_index_config(database, table_name):
+    # The configuration of the vector indexes is kept as the table comment
+    with database.sync_engine.connect() as conn:
+        comment = conn.execute(text("SELECT obj_description(to_regclass(:table_name), 'pg_class')"), {"table_name": table_name}).scalar()
+
+    return json.loads(comment) if comment else None
+
+def save_index_config(database, table_name, config):
+    """
+    Store the configuration of the vector indexes of a table, None clears it before the indexes are dropped.
+
+    A table without a saved configuration has its indexes rebuilt by the next create_embeddings run.
+    """
+    # COMMENT doesn't take bind parameters, the JSON is escaped as a SQL string literal
+    comment = "NULL" if config is None else "'" + json.dumps(config).replace("'", "''") + "'"
+    with database.sync_engine.begin() as conn:
+        conn.exec_driver_sql(f'COMMENT ON TABLE "{table_name}" IS {comment}')
@@ -1,16 +1,25 @@
 from __future__ import annotations
-from dotenv import dotenv_values
-from langchain_postgres import PGEngine
 from langchain_postgres import PGVectorStore
 from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import START, StateGraph
-from load_model import load_llm
+from load_model import load_llm, load_embeddings, configure_torch_threads
 from typing import Dict, List, TypedDict
 from reranker import Reranker
 from bm25 import BM25, preprocess_persian
+from fusion import fuse
+from vector_index import LocalVectorStore
+from pgvector_index import vector_query_options
+from database import Database
+from cache import LRUCache, SQLiteCache, TieredCache, SemanticCache, normalize_question
+from concurrent.futures import ThreadPoolExecutor
 import unicodedata
+import hashlib
+import asyncio
+import time
+
+EMBEDDING_QUERY_INSTRUCTION = "Instruct: Given a web search query, retrieve relevant passages that answer the query\nQuery: "
 
 # Define state for application
 class State(TypedDict):
@@ -19,6 +28,8 @@ class State(TypedDict):
     model_category: str
     context: List[Document]
     answer: str
+    timings: Dict[str, float]
+    num_reranked: int
 
 class RAG(object):
     @classmethod
@@ -27,12 +38,52 @@ class RAG(object):
         embedding_table_name,
         embedding_model,
         embedding_size,
+        embedding_backend,
+        inference_device,
+        inference_dtype,
+        torch_num_threads,
+        torch_num_interop_threads,
         embedding_score_threshold,
+        vector_backend,
+        vector_index_dtype,
+        pgvector_index_type,
+        pgvector_probes,
+        pgvector_ef_search,
+        db_pool_size,
+        db_max_overflow,
+        db_pool_timeout,
+        db_pool_pre_ping,
+        db_statement_timeout_ms,
+        db_prepare_threshold,
         bm25_score_threshold,
         bm25_k1,
         bm25_b,
+        bm25_num_workers,
+        fusion_method,
+        fusion_weights,
+        fusion_rrf_k,
+        fusion_top_n,
         reranker_threshold,
+        reranker_backend,
+        reranker_max_length,
+        reranker_type_max_length,
+        reranker_bucket_size,
+        reranker_batch_size,
+        reranker_max_wait_ms,
+        reranker_cache_size,
+        reranker_cache_path,
+        reranker_cache_max_entries,
+        reranker_cache_ttl,
         num_retrieved,
+        embedding_cache_size,
+        embedding_cache_ttl,
+        translation_cache_size,
+        translation_cache_path,
+        translation_cache_max_entries,
+        translation_cache_ttl,
+        answer_cache_size,
+        answer_cache_threshold,
+        answer_cache_ttl,
         reader_prompt,
         translation_prompt,
         reader_models,
@@ -40,16 +91,14 @@ class RAG(object):
         ghazal_path,
         masnavi_path,
         programs_path,
+        embeddings_path,
         dotenv_path=".env",
     ):
         self = cls()
-        # Load config
-        config = dotenv_values(dotenv_path)
-        pg_user = config["POSTGRES_USER"]
-        pg_password = config["POSTGRES_PASSWORD"]
-        pg_hostname = config["POSTGRES_HOSTNAME"]
-        pg_db = config["POSTGRES_DB"]
-        connection_string = f"postgresql+psycopg://{pg_user}:{pg_password}@{pg_hostname}/{pg_db}"
+        self.database = None
+
+        # Thread pools are process-wide and must be sized before the models run
+        configure_torch_threads(torch_num_threads, torch_num_interop_threads)
 
         self.reader_prompt_template = PromptTemplate.from_template(reader_prompt)
         self.translation_prompt_template = PromptTemplate.from_template(translation_prompt)
@@ -58,19 +107,39 @@ class RAG(object):
         self.bm25_score_threshold = bm25_score_threshold
         self.bm25_k1 = bm25_k1
         self.bm25_b = bm25_b
+        self.bm25_num_workers = bm25_num_workers
+        self.fusion_method = fusion_method
+        self.fusion_weights = fusion_weights
+        self.fusion_rrf_k = fusion_rrf_k
+        self.fusion_top_n = fusion_top_n
         self.reranker_threshold = reranker_threshold
-
-        # Create Postgres engine
-        self.engine = PGEngine.from_connection_string(url=connection_string)
+        self.embedding_cache = LRUCache(max_size=embedding_cache_size, ttl=embedding_cache_ttl)
+        self.translation_cache = TieredCache(
+            LRUCache(max_size=translation_cache_size),
+            SQLiteCache(
+                translation_cache_path,
+                table="translations",
+                max_entries=translation_cache_max_entries,
+                ttl=translation_cache_ttl,
+            ) if translation_cache_path else None,
+        )
+        # Answers of paraphrased questions, disabled when answer_cache_size is 0
+        self.answer_cache = SemanticCache(
+            max_size=answer_cache_size,
+            threshold=answer_cache_threshold,
+            ttl=answer_cache_ttl,
+        )
+        # Cached translations are only reused with the same model and prompt
+        self.translation_cache_scope = f"{translation_model}:{hashlib.sha256(translation_prompt.encode('utf-8')).hexdigest()[:16]}"
 
         # Load embedding model
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=embedding_model,
-            encode_kwargs={
-                "normalize_embeddings": True,
-                "truncate_dim": embedding_size,
-            },
-        )        
+        self.embeddings = load_embeddings(
+            embedding_model,
+            embedding_size,
+            backend=embedding_backend,
+            device=inference_device,
+            dtype=inference_dtype,
+        )
 
         # Initialize LLMs
         self.reader_models = {
@@ -78,36 +147,187 @@ class RAG(object):
             for model_category, model_name in reader_models.items()
         }
 
-        self.bm25_retriever = BM25().create([ghazal_path, masnavi_path, programs_path], index_name='index', b=self.bm25_b, k1=self.bm25_k1)
-        
-        # Create vector store
-        self.vector_store = await PGVectorStore.create(
-            engine=self.engine,
-            table_name=embedding_table_name,
-            embedding_service=self.embeddings,
-            metadata_columns=["type", "number", "part", "translation"],
+        self.bm25_retriever = BM25().create(
+            [ghazal_path, masnavi_path, programs_path],
+            index_name='index',
+            b=self.bm25_b,
+            k1=self.bm25_k1,
+            num_workers=self.bm25_num_workers,
         )
+        
+        # Create vector store, the local one searches the dumped embedding table in-process
+        if vector_backend == "local":
+            self.vector_store = LocalVectorStore.create(
+                embeddings_path,
+                embedding_service=self.embeddings,
+                index_name='index',
+                dtype=vector_index_dtype,
+            )
+        elif vector_backend == "pgvector":
+            self.database = Database(
+                dotenv_path=dotenv_path,
+                pool_size=db_pool_size,
+                max_overflow=db_max_overflow,
+                pool_timeout=db_pool_timeout,
+                pool_pre_ping=db_pool_pre_ping,
+                statement_timeout_ms=db_statement_timeout_ms,
+                prepare_threshold=db_prepare_threshold,
+            )
+            # Connections are opened now rather than by the first queries
+            await self.database.warm_up()
+
+            self.vector_store = await PGVectorStore.create(
+                engine=self.database.pg_engine,
+                table_name=embedding_table_name,
+                embedding_service=self.embeddings,
+                metadata_columns=["type", "number", "part", "translation"],
+                # ivfflat.probes or hnsw.ef_search, set before each search
+                index_query_options=vector_query_options(
+                    pgvector_index_type,
+                    probes=pgvector_probes,
+                    ef_search=pgvector_ef_search,
+                ),
+            )
+        else:
+            raise ValueError(f"Unknown vector backend {vector_backend}, expected pgvector or local")
 
         # Load reranker
-        self.reranker = Reranker()
+        self.reranker = Reranker(
+            max_length=reranker_max_length,
+            type_max_length=reranker_type_max_length,
+            bucket_size=reranker_bucket_size,
+            max_batch_size=reranker_batch_size,
+            max_wait=reranker_max_wait_ms / 1000,
+            cache_size=reranker_cache_size,
+            cache_path=reranker_cache_path,
+            cache_max_entries=reranker_cache_max_entries,
+            cache_ttl=reranker_cache_ttl,
+            backend=reranker_backend,
+            device=inference_device,
+            dtype=inference_dtype,
+        )
+
+        # Runs the vector search while the question is translated and searched with BM25
+        self.retrieval_executor = ThreadPoolExecutor(thread_name_prefix="rag-retrieve")
 
         # Load translation models
         self.translation_model = load_llm(translation_model, translation=True)
 
         # Compile application and test
-        graph_builder = StateGraph(State).add_sequence([self._retrieve, self._generate])
+        # Each node has a sync and an async implementation, used by query and aquery
+        graph_builder = StateGraph(State).add_sequence([
+            ("_retrieve", RunnableLambda(self._retrieve, afunc=self._aretrieve)),
+            ("_generate", RunnableLambda(self._generate, afunc=self._agenerate)),
+        ])
         graph_builder.add_edge(START, "_retrieve")
         self.rag_graph = graph_builder.compile()        
 
         return self
         
     def query(self, query: str, model_category: str, selected_types: list = []) -> Dict[str, object]:
-        return self.rag_graph.invoke({
+        cached_answer, cache_key = self._cached_answer(query, model_category, selected_types)
+        if cached_answer is not None:
+            return cached_answer
+
+        response = self.rag_graph.invoke({
+           "question": query,
+           "model_category": model_category,
+           "selected_types": selected_types
+        })
+        self._cache_answer(cache_key, response)
+        return response
+
+    async def aquery(self, query: str, model_category: str, selected_types: list = []) -> Dict[str, object]:
+        cached_answer, cache_key = await asyncio.to_thread(self._cached_answer, query, model_category, selected_types)
+        if cached_answer is not None:
+            return cached_answer
+
+        response = await self.rag_graph.ainvoke({
            "question": query,
            "model_category": model_category,
            "selected_types": selected_types
         })
+        self._cache_answer(cache_key, response)
+        return response
     
+    async def astream(self, query: str, model_category: str, selected_types: list = []):
+        """
+        Yield the reranked references first, then the answer tokens as the reader model generates them.
+        """
+        state, cache_key = await asyncio.to_thread(self._cached_answer, query, model_category, selected_types)
+        cache_hit = state is not None
+
+        if not cache_hit:
+            state = {
+               "question": query,
+               "model_category": model_category,
+               "selected_types": selected_types
+            }
+            state.update(await self._aretrieve(state))
+
+        yield {
+            "references": [
+                {
+                    "page_content": doc.page_content,
+                    "metadata": doc.metadata
+                }
+                for doc in state["context"]
+            ]
+        }
+
+        # A cached answer is sent as a single token
+        if cache_hit:
+            yield {"token": state["answer"]}
+            return
+
+        tokens = []
+        messages = self._reader_messages(state)
+        async for chunk in self.reader_models[model_category].astream(messages):
+            tokens.append(chunk.content)
+            yield {"token": chunk.content}
+
+        state["answer"] = "".join(tokens)
+        self._cache_answer(cache_key, state)
+
+    def _answer_scope(self, query, model_category, selected_types):
+        # The reader answers in the language of the question, paraphrases in another language don't share answers
+        language = "fa" if self._is_alphabet_persian(query) else "other"
+        return f"{model_category}:{','.join(sorted(selected_types))}:{language}"
+
+    def _cached_answer(self, query, model_category, selected_types):
+        """
+        Return the cached response of a similar question, or None, and the key to cache the new response with.
+        """
+        if self.answer_cache.max_size <= 0:
+            return None, None
+
+        embedding = self._embed_query(query)
+        scope = self._answer_scope(query, model_category, selected_types)
+        cached_answer = self.answer_cache.get(scope, embedding)
+
+        if cached_answer is None:
+            return None, (scope, embedding)
+
+        print(f"Answer cache hit for: {query}")
+        return {
+            **cached_answer,
+            "question": query,
+            "timings": {},
+            "num_reranked": 0,
+        }, (scope, embedding)
+
+    def _cache_answer(self, cache_key, response):
+        if cache_key is None or not response.get("answer"):
+            return
+
+        scope, embedding = cache_key
+        self.answer_cache.put(scope, embedding, {
+            "model_category": response["model_category"],
+            "selected_types": response["selected_types"],
+            "context": response["context"],
+            "answer": response["answer"],
+        })
+
     def similarity(self, query: str, number_results: int):    
         results = self.vector_store.similarity_search(query, k=number_results)
 
@@ -120,51 +340,158 @@ class RAG(object):
         ]
 
     def _retrieve(self, state: State):
+        timings = {}
         metadata_filter = dict()
 
         if len(state['selected_types']) >= 1:
             metadata_filter["type"] = {"$in": state['selected_types']}
 
+        # The vector search uses the original question, it doesn't wait for the translation
+        vector_search = self.retrieval_executor.submit(
+            self._timed, timings, "vector_search", self._vector_search, state["question"], metadata_filter
+        )
+
         # Translate question
         if self._is_alphabet_persian(state['question']):
             persian_question = state['question']
         else:
-            translation = self.translation_prompt_template.invoke({"question": state['question']})
-            persian_question = self.translation_model.invoke(translation).content
+            persian_question = self._timed(timings, "translation", self._translate, state['question'])
             print(f"Translated as (2): {persian_question}")
-            
 
-        retrieved_documents = []
+        bm25_results = self._timed(timings, "bm25", self._bm25_search, persian_question, state['selected_types'])
+        retrieved_documents = self._fuse(bm25_results, vector_search.result())
+        num_reranked = len(retrieved_documents)
+
+        retrieved_documents = self._timed(
+            timings, "rerank", self.reranker.rerank,
+            persian_question,
+            retrieved_documents,
+            threshold=self.reranker_threshold
+        )
+
+        print(f"Retrieval timings (s): {timings}")
+
+        return {
+            "context": retrieved_documents,
+            "timings": timings,
+            "num_reranked": num_reranked,
+        }
+
+    async def _aretrieve(self, state: State):
+        timings = {}
+        metadata_filter = dict()
+
+        if len(state['selected_types']) >= 1:
+            metadata_filter["type"] = {"$in": state['selected_types']}
+
+        # The vector search uses the original question, it doesn't wait for the translation
+        vector_search = asyncio.create_task(
+            self._atimed(timings, "vector_search", self._avector_search(state["question"], metadata_filter))
+        )
+
+        # Translate question
+        if self._is_alphabet_persian(state['question']):
+            persian_question = state['question']
+        else:
+            persian_question = await self._atimed(timings, "translation", self._atranslate(state['question']))
+            print(f"Translated as (2): {persian_question}")
+
+        # BM25 and the reranker are CPU bound, they run outside the event loop
+        bm25_results = await self._atimed(
+            timings, "bm25", asyncio.to_thread(self._bm25_search, persian_question, state['selected_types'])
+        )
+        retrieved_documents = self._fuse(bm25_results, await vector_search)
+        num_reranked = len(retrieved_documents)
+
+        retrieved_documents = await self._atimed(
+            timings, "rerank", asyncio.to_thread(
+                self.reranker.rerank,
+                persian_question,
+                retrieved_documents,
+                threshold=self.reranker_threshold
+            )
+        )
+
+        print(f"Retrieval timings (s): {timings}")
+
+        return {
+            "context": retrieved_documents,
+            "timings": timings,
+            "num_reranked": num_reranked,
+        }
+
+    def _bm25_search(self, persian_question, selected_types):
         preprocessed_query = preprocess_persian(persian_question) # Important we need to preprocess the query before BM25!
 
         print(f"preprocessed_query: {preprocessed_query}")
-    
-        # We filter documents afterhand
+
+        # Types are filtered inside the single bm25 index, before the top-k,
         # because doing seperate bm25 index
         # doesn't normalize document length correctly
-        bm25_documents = self.bm25_retriever.retrieve(preprocessed_query, limit=self.num_retrieved, threshold=self.bm25_score_threshold)
-        for retrieved_doc in bm25_documents:
-            if retrieved_doc.metadata['type'] in state['selected_types']:
-                retrieved_documents.append(retrieved_doc)
+        return self.bm25_retriever.retrieve_with_scores(
+            preprocessed_query,
+            limit=self.num_retrieved,
+            threshold=self.bm25_score_threshold,
+            types=selected_types or None,
+        )
 
-        embedding_search_results = self.vector_store.similarity_search_with_score(
-            f"Instruct: Given a web search query, retrieve relevant passages that answer the query\nQuery: {state["question"]}",
+    def _vector_search(self, question, metadata_filter):
+        embedding_search_results = self.vector_store.similarity_search_with_score_by_vector(
+            self._embed_query(question),
             k=self.num_retrieved, filter=metadata_filter
         )
 
-        retrieved_documents.extend([doc for doc, score in embedding_search_results if score >= self.embedding_score_threshold])
+        return [(doc, score) for doc, score in embedding_search_results if score >= self.embedding_score_threshold]
 
-        retrieved_documents = self.reranker.rerank(
-            persian_question,
-            retrieved_documents,
-            threshold=self.reranker_threshold
+    async def _avector_search(self, question, metadata_filter):
+        embedding = await asyncio.to_thread(self._embed_query, question)
+        embedding_search_results = await self.vector_store.asimilarity_search_with_score_by_vector(
+            embedding,
+            k=self.num_retrieved, filter=metadata_filter
+        )
+
+        return [(doc, score) for doc, score in embedding_search_results if score >= self.embedding_score_threshold]
+
+    def _fuse(self, bm25_results, vector_results):
+        # Only the best fused candidates go through the cross-encoder,
+        # vector scores are cosine distances so they are negated to rank higher is better
+        return fuse(
+            {"bm25": bm25_results, "vector": [(doc, -distance) for doc, distance in vector_results]},
+            method=self.fusion_method,
+            weights=self.fusion_weights,
+            limit=self.fusion_top_n,
+            rrf_k=self.fusion_rrf_k,
         )
 
+    def _timed(self, timings, name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings[name] = time.perf_counter() - start
+        return result
+
+    async def _atimed(self, timings, name, awaitable):
+        start = time.perf_counter()
+        result = await awaitable
+        timings[name] = time.perf_counter() - start
+        return result
+
+    def _generate(self, state: State):
+        messages = self._reader_messages(state)
+        response = self.reader_models[state['model_category']].invoke(messages).content
+
         return {
-            "context": retrieved_documents,
+            "answer": response,
         }
 
-    def _generate(self, state: State):
+    async def _agenerate(self, state: State):
+        messages = self._reader_messages(state)
+        response = (await self.reader_models[state['model_category']].ainvoke(messages)).content
+
+        return {
+            "answer": response,
+        }
+
+    def _reader_messages(self, state: State):
         docs_content = ""
 
         for doc_rank, doc in enumerate(state["context"][:5]):
@@ -175,13 +502,57 @@ class RAG(object):
         else:
             length = "Keep your answers as short as possible, think three sentences max."
 
-        messages = self.reader_prompt_template.invoke({"question": state["question"], "context": docs_content, "length": length})
-        response = self.reader_models[state['model_category']].invoke(messages).content
+        return self.reader_prompt_template.invoke({"question": state["question"], "context": docs_content, "length": length})
 
+    def cache_stats(self):
         return {
-            "answer": response,
+            "embedding": self.embedding_cache.stats(),
+            "translation": self.translation_cache.stats(),
+            "rerank": self.reranker.score_cache.stats(),
+            "answer": self.answer_cache.stats(),
         }
 
+    def pool_stats(self):
+        # The local vector backend doesn't use Postgres
+        return self.database.stats() if self.database is not None else {}
+
+    def _translation_key(self, question):
+        return f"{self.translation_cache_scope}:{normalize_question(question).casefold()}"
+
+    def _translate(self, question):
+        key = self._translation_key(question)
+        persian_question = self.translation_cache.get(key)
+
+        if persian_question is None:
+            translation = self.translation_prompt_template.invoke({"question": question})
+            persian_question = self.translation_model.invoke(translation).content
+            self.translation_cache.put(key, persian_question)
+
+        return persian_question
+
+    async def _atranslate(self, question):
+        # The disk tier of the cache is a blocking SQLite query, kept off the event loop
+        key = self._translation_key(question)
+        persian_question = await asyncio.to_thread(self.translation_cache.get, key)
+
+        if persian_question is None:
+            translation = self.translation_prompt_template.invoke({"question": question})
+            persian_question = (await self.translation_model.ainvoke(translation)).content
+            await asyncio.to_thread(self.translation_cache.put, key, persian_question)
+
+        return persian_question
+
+    def _embed_query(self, question):
+        # Repeated questions only differing by spaces or unicode forms share their embedding
+        question = normalize_question(question)
+        embedding = self.embedding_cache.get(question)
+
+        if embedding is None:
+            embedding = self.embeddings.embed_query(f"{EMBEDDING_QUERY_INSTRUCTION}{question}")
+            self.embedding_cache.put(question, embedding)
+
+        return embedding
+
     def _is_alphabet_persian(self, text):
         total_fa = 0
 
@@ -1,20 +1,192 @@
 # Requires transformers>=4.51.0
-import torch
-from sentence_transformers import CrossEncoder
+from concurrent.futures import Future
+from load_model import load_cross_encoder, inference_scope
+from cache import LRUCache, SQLiteCache, TieredCache, normalize_question
+import numpy as np
+import threading
+import hashlib
+import queue
+import time
+
+RERANKER_MODEL = 'jinaai/jina-reranker-v2-base-multilingual'
+
+class RerankBatcher:
+    """
+    Coalesces the (query, document) pairs of concurrent rerank calls into shared forward passes.
+
+    Pairs are queued until max_batch_size pairs are waiting or the oldest
+    request waited max_wait seconds, then scored together and scattered back.
+    """
+
+    def __init__(self, score, max_batch_size: int, max_wait: float):
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._thread.start()
+
+    def predict(self, pairs):
+        future = Future()
+        self._requests.put((pairs, future))
+        return future.result()
+
+    def _next_batch(self):
+        requests = [self._requests.get()]
+        num_pairs = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while num_pairs < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            requests.append(request)
+            num_pairs += len(request[0])
+
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._next_batch()
+            pairs = [pair for request_pairs, _ in requests for pair in request_pairs]
+
+            try:
+                scores = self.score(pairs)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_pairs, future in requests:
+                future.set_result(scores[offset:offset + len(request_pairs)])
+                offset += len(request_pairs)
 
 class Reranker:
-    def __init__(self, model_name='jinaai/jina-reranker-v2-base-multilingual'):
-        self.model = CrossEncoder(
+    def __init__(
+        self,
+        model_name=RERANKER_MODEL,
+        max_length=1024,
+        type_max_length=None,
+        bucket_size=16,
+        max_batch_size=64,
+        max_wait=0.01,
+        cache_size=0,
+        cache_path=None,
+        cache_max_entries=None,
+        cache_ttl=None,
+        backend="torch",
+        device="auto",
+        dtype="auto",
+    ):
+        self.model = load_cross_encoder(
             model_name,
-            max_length=1024,
-            device='mps' if torch.backends.mps.is_available() else 'cpu',
+            backend=backend,
+            device=device,
+            dtype=dtype,
+            max_length=max_length,
             trust_remote_code=True
         )
-    
+        self.tokenizer = self.model.tokenizer
+        self.max_length = max_length
+        self.type_max_length = type_max_length or {}
+        self.bucket_size = bucket_size
+
+        # Without a waiting time each request runs its own forward pass
+        self.batcher = RerankBatcher(self._score, max_batch_size, max_wait) if max_wait > 0 else None
+
+        # Scores depend on the model, its backend, device and dtype and on how documents are truncated
+        truncation = f"{max_length}:{sorted(self.type_max_length.items())}"
+        self.cache_scope = f"{model_name}:{inference_scope(backend, device, dtype)}:{hashlib.sha256(truncation.encode('utf-8')).hexdigest()[:16]}"
+        self.score_cache = TieredCache(
+            LRUCache(max_size=cache_size),
+            SQLiteCache(cache_path, table="rerank_scores", max_entries=cache_max_entries, ttl=cache_ttl) if cache_path else None,
+        )
+
+    def predict(self, pairs):
+        """
+        Score (query, document text, number of tokens) triples.
+        """
+        if not pairs:
+            return np.empty(0)
+
+        if self.batcher is None:
+            return self._score(pairs)
+
+        return self.batcher.predict(pairs)
+
+    def _truncate(self, documents):
+        # Documents are cut to the token budget of their type at a token boundary,
+        # so two-line beyts and long program chunks don't share the same padding
+        texts = [doc.page_content for doc in documents]
+        offsets = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+
+        truncated_texts = []
+        num_tokens = []
+
+        for doc, text, token_offsets in zip(documents, texts, offsets):
+            max_length = self.type_max_length.get(doc.metadata['type'], self.max_length)
+
+            if len(token_offsets) > max_length:
+                text = text[:token_offsets[max_length - 1][1]]
+
+            truncated_texts.append(text)
+            num_tokens.append(min(len(token_offsets), max_length))
+
+        return truncated_texts, num_tokens
+
+    def _score(self, pairs):
+        # Sort pairs by length and score them in buckets of similar length,
+        # scores are written back at the original position of each pair
+        order = np.argsort([num_tokens for _, _, num_tokens in pairs], kind="stable")
+        scores = np.empty(len(pairs))
+        bucket_timings = []
+
+        for start in range(0, len(order), self.bucket_size):
+            bucket = order[start:start + self.bucket_size]
+
+            start_time = time.perf_counter()
+            scores[bucket] = self.model.predict(
+                [[pairs[i][0], pairs[i][1]] for i in bucket],
+                batch_size=len(bucket),
+                show_progress_bar=False
+            )
+            bucket_timings.append((len(bucket), pairs[bucket[-1]][2], round(time.perf_counter() - start_time, 4)))
+
+        print(f"Rerank buckets (pairs, max tokens, seconds): {bucket_timings}")
+        return scores
+
+    def _document_key(self, doc):
+        return doc.metadata.get('id') or hashlib.sha256(doc.page_content.encode('utf-8')).hexdigest()
+
+    def _cached_scores(self, query, documents):
+        # Only the (query, document) pairs missing from the cache go through the cross-encoder
+        normalized_query = normalize_question(query)
+        keys = [f"{self.cache_scope}:{normalized_query}:{self._document_key(doc)}" for doc in documents]
+        scores = np.array([self.score_cache.get(key, np.nan) for key in keys], dtype=np.float64)
+        missing = np.flatnonzero(np.isnan(scores))
+
+        if len(missing):
+            missing_documents = [documents[i] for i in missing]
+            texts, num_tokens = self._truncate(missing_documents)
+            query_tokens = len(self.tokenizer(query, add_special_tokens=False)["input_ids"])
+
+            pairs = [(query, text, query_tokens + doc_tokens) for text, doc_tokens in zip(texts, num_tokens)]
+            scores[missing] = self.predict(pairs)
+            self.score_cache.put_many([(keys[i], float(scores[i])) for i in missing])
+
+        return scores
+
     def rerank(self, query: str, documents: list, threshold: float):
         # if len(documents) <= top_k:
         #     return documents
-        
+
         seen_docs = set()
         unique_documents = []
 
@@ -23,11 +195,13 @@ class Reranker:
                 seen_docs.add(doc.page_content)
                 unique_documents.append(doc)
 
-        pairs = [[query, doc.page_content] for doc in unique_documents]
-        scores = self.model.predict(pairs, show_progress_bar=False)
-        
+        if not unique_documents:
+            return []
+
+        scores = self._cached_scores(query, unique_documents)
+
         # Add scores to documents and sort
         scored_docs = list(zip(unique_documents, scores))
         scored_docs.sort(key=lambda x: x[1], reverse=True)
 
-        return [doc for doc, score in scored_docs if score > threshold]
\ No newline at end of file
+        return [doc for doc, score in scored_docs if score > threshold]
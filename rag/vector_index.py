@@ -0,0 +1,172 @@
+from document_store import DocumentStore, DOCUMENT_SCHEMA
+from array_index import ArrayIndex, type_document_ids, candidate_ids
+import pyarrow as pa
+import pyarrow.parquet as pq
+import numpy as np
+import asyncio
+import hashlib
+import json
+import uuid
+
+VECTOR_INDEX_VERSION = 1
+VECTOR_INDEX_DTYPES = ("float32", "float16", "int8")
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class VectorIndex(ArrayIndex):
+    """
+    Exact cosine search over normalized embeddings stored as a float32, float16 or int8 matrix.
+
+    int8 rows are quantized symmetrically with one scale per row, the scale is
+    applied to the dot products so the matrix itself is never dequantized.
+    """
+
+    _arrays = ["vectors", "scales"]
+    _description = "Vector index"
+
+    def __init__(self, vectors, scales):
+        self.vectors = vectors
+        self.scales = scales
+        self.num_vectors = len(vectors)
+
+    @classmethod
+    def build(cls, embeddings, dtype="float16"):
+        if dtype not in VECTOR_INDEX_DTYPES:
+            raise ValueError(f"Unknown vector index dtype {dtype}, expected one of {VECTOR_INDEX_DTYPES}")
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        if dtype == "int8":
+            scales = np.abs(embeddings).max(axis=1) / 127
+            scales[scales == 0] = 1
+            vectors = np.round(embeddings / scales[:, None]).astype(np.int8)
+        else:
+            scales = np.ones(len(embeddings))
+            vectors = embeddings.astype(dtype)
+
+        return cls(vectors=vectors, scales=scales.astype(np.float32))
+
+    def similarities(self, query, rows=None, chunk_size=8192):
+        query = np.asarray(query, dtype=np.float32)
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        scales = self.scales if rows is None else self.scales[rows]
+        similarities = np.empty(len(vectors), dtype=np.float32)
+
+        # Rows are upcast chunk by chunk, the whole matrix is never copied to float32
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            similarities[start:start + chunk_size] = chunk.astype(np.float32) @ query
+
+        return similarities * scales
+
+class LocalVectorStore:
+    """
+    In-process replacement for PGVectorStore built from the dump of the embedding table.
+
+    Implements the similarity search methods used by RAG, with the same
+    scores as pgvector's default strategy (cosine distance, lower is better)
+    and filters restricted to the document type.
+    """
+
+    def __init__(self, embedding_service):
+        self.embedding_service = embedding_service
+        self.documents = None
+        self.index = None
+        self.type_document_ids = {}
+
+    @classmethod
+    def create(cls, embeddings_path, embedding_service, index_name, dtype="float16"):
+        self = cls(embedding_service)
+        index_path = f'data/{index_name}_vectors'
+
+        # Columns of the langchain_postgres table, renamed to the document store schema
+        columns = {
+            "langchain_id": "id",
+            "type": "type",
+            "number": "number",
+            "part": "part",
+            "content": "page_content",
+            "translation": "translation",
+        }
+        table = pq.read_table(embeddings_path, columns=list(columns), memory_map=True).select(list(columns))
+        table = table.set_column(0, "langchain_id", cls._string_ids(table.column("langchain_id"), embeddings_path))
+        self.documents = DocumentStore(table.rename_columns(list(columns.values())).cast(DOCUMENT_SCHEMA))
+
+        header = {
+            "version": VECTOR_INDEX_VERSION,
+            "embeddings_hash": file_hash(embeddings_path),
+            "dtype": dtype,
+        }
+
+        print(f"Loading pre-computed vector index from {index_path}...")
+        self.index = VectorIndex.load(index_path, header)
+
+        if self.index is None:
+            print(f"Creating vector index for {embeddings_path}...")
+            self.index = VectorIndex.build(cls._read_embeddings(embeddings_path), dtype=dtype)
+            self.index.save(index_path, header)
+            print(f"Saved vector index: {index_path}")
+
+        self.type_document_ids = type_document_ids(self.documents)
+
+        return self
+
+    @staticmethod
+    def _string_ids(column, embeddings_path):
+        # Ids are canonical UUID strings, dumps holding them as arrow.uuid or 16 byte binaries are converted
+        if isinstance(column.type, pa.BaseExtensionType):
+            column = pa.chunked_array([chunk.storage for chunk in column.chunks], type=column.type.storage_type)
+
+        if pa.types.is_fixed_size_binary(column.type) or pa.types.is_binary(column.type):
+            return pa.array(
+                [None if value is None else str(uuid.UUID(bytes=value)) for value in column.to_pylist()],
+                type=pa.string(),
+            )
+
+        if not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+            raise TypeError(f"langchain_id of {embeddings_path} must hold UUID strings, got {column.type}")
+
+        return column
+
+    @staticmethod
+    def _read_embeddings(embeddings_path):
+        column = pq.read_table(embeddings_path, columns=["embedding"]).column("embedding")
+
+        # Without the pgvector adapter, the dump holds the text representation "[x, y, ...]" of vectors
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            return np.array([json.loads(value) for value in column.to_pylist()], dtype=np.float32)
+
+        return np.stack(column.to_numpy(zero_copy_only=False)).astype(np.float32)
+
+    def _candidate_ids(self, filter):
+        if not filter:
+            return None
+
+        if set(filter) != {"type"}:
+            raise ValueError(f"LocalVectorStore only filters on type, got {filter}")
+
+        types = filter["type"]["$in"] if isinstance(filter["type"], dict) else [filter["type"]]
+        return candidate_ids(self.type_document_ids, types)
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        candidate_ids = self._candidate_ids(filter)
+        similarities = self.index.similarities(embedding, candidate_ids)
+        top_rows = self.index.top_k(similarities, k)
+        document_rows = top_rows if candidate_ids is None else candidate_ids[top_rows]
+
+        return list(zip(
+            self.documents.take(document_rows),
+            (1 - similarities[top_rows]).tolist(),
+        ))
+
+    async def asimilarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return await asyncio.to_thread(self.similarity_search_with_score_by_vector, embedding, k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        embedding = self.embedding_service.embed_query(query)
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
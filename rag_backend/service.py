@@ -1,7 +1,8 @@
 from __future__ import annotations
 import bentoml
 import yaml
-from typing import Dict
+import json
+from typing import AsyncGenerator, Dict
 from bentoml.exceptions import InvalidArgument
 
 with bentoml.importing():
@@ -31,12 +32,52 @@ class RAGService:
         self.embedding_table_name = rag_params["embedding_table_name"]
         self.embedding_model = rag_params["embedding_model"]
         self.embedding_size = rag_params["embedding_size"]
+        self.embedding_backend = rag_params["embedding_backend"]
+        self.inference_device = rag_params["inference_device"]
+        self.inference_dtype = rag_params["inference_dtype"]
+        self.torch_num_threads = rag_params["torch_num_threads"]
+        self.torch_num_interop_threads = rag_params["torch_num_interop_threads"]
         self.embedding_score_threshold = rag_params["embedding_score_threshold"]
+        self.vector_backend = rag_params["vector_backend"]
+        self.vector_index_dtype = rag_params["vector_index_dtype"]
+        self.pgvector_index_type = rag_params["pgvector_index_type"]
+        self.pgvector_probes = rag_params["pgvector_probes"]
+        self.pgvector_ef_search = rag_params["pgvector_ef_search"]
+        self.db_pool_size = rag_params["db_pool_size"]
+        self.db_max_overflow = rag_params["db_max_overflow"]
+        self.db_pool_timeout = rag_params["db_pool_timeout"]
+        self.db_pool_pre_ping = rag_params["db_pool_pre_ping"]
+        self.db_statement_timeout_ms = rag_params["db_statement_timeout_ms"]
+        self.db_prepare_threshold = rag_params["db_prepare_threshold"]
         self.bm25_score_threshold = rag_params["bm25_score_threshold"]
         self.bm25_k1 = rag_params["bm25_k1"]
         self.bm25_b = rag_params["bm25_b"]
+        self.bm25_num_workers = rag_params["bm25_num_workers"]
+        self.fusion_method = rag_params["fusion_method"]
+        self.fusion_weights = rag_params["fusion_weights"]
+        self.fusion_rrf_k = rag_params["fusion_rrf_k"]
+        self.fusion_top_n = rag_params["fusion_top_n"]
         self.reranker_threshold = rag_params["reranker_threshold"]
+        self.reranker_backend = rag_params["reranker_backend"]
+        self.reranker_max_length = rag_params["reranker_max_length"]
+        self.reranker_type_max_length = rag_params["reranker_type_max_length"]
+        self.reranker_bucket_size = rag_params["reranker_bucket_size"]
+        self.reranker_batch_size = rag_params["reranker_batch_size"]
+        self.reranker_max_wait_ms = rag_params["reranker_max_wait_ms"]
+        self.reranker_cache_size = rag_params["reranker_cache_size"]
+        self.reranker_cache_path = rag_params["reranker_cache_path"]
+        self.reranker_cache_max_entries = rag_params["reranker_cache_max_entries"]
+        self.reranker_cache_ttl = rag_params["reranker_cache_ttl"]
         self.num_retrieved = rag_params["num_retrieved"]
+        self.embedding_cache_size = rag_params["embedding_cache_size"]
+        self.embedding_cache_ttl = rag_params["embedding_cache_ttl"]
+        self.translation_cache_size = rag_params["translation_cache_size"]
+        self.translation_cache_path = rag_params["translation_cache_path"]
+        self.translation_cache_max_entries = rag_params["translation_cache_max_entries"]
+        self.translation_cache_ttl = rag_params["translation_cache_ttl"]
+        self.answer_cache_size = rag_params["answer_cache_size"]
+        self.answer_cache_threshold = rag_params["answer_cache_threshold"]
+        self.answer_cache_ttl = rag_params["answer_cache_ttl"]
         self.translation_model = rag_params["translation_model"]
         self.reader_models = {
             "fast": rag_params["reader_models_fast"],
@@ -50,32 +91,91 @@ class RAGService:
             embedding_table_name=self.embedding_table_name,
             embedding_model=self.embedding_model,
             embedding_size=self.embedding_size,
+            embedding_backend=self.embedding_backend,
+            inference_device=self.inference_device,
+            inference_dtype=self.inference_dtype,
+            torch_num_threads=self.torch_num_threads,
+            torch_num_interop_threads=self.torch_num_interop_threads,
             embedding_score_threshold=self.embedding_score_threshold,
+            vector_backend=self.vector_backend,
+            vector_index_dtype=self.vector_index_dtype,
+            pgvector_index_type=self.pgvector_index_type,
+            pgvector_probes=self.pgvector_probes,
+            pgvector_ef_search=self.pgvector_ef_search,
+            db_pool_size=self.db_pool_size,
+            db_max_overflow=self.db_max_overflow,
+            db_pool_timeout=self.db_pool_timeout,
+            db_pool_pre_ping=self.db_pool_pre_ping,
+            db_statement_timeout_ms=self.db_statement_timeout_ms,
+            db_prepare_threshold=self.db_prepare_threshold,
             bm25_score_threshold=self.bm25_score_threshold,
             bm25_k1=self.bm25_k1,
             bm25_b=self.bm25_b,
+            bm25_num_workers=self.bm25_num_workers,
+            fusion_method=self.fusion_method,
+            fusion_weights=self.fusion_weights,
+            fusion_rrf_k=self.fusion_rrf_k,
+            fusion_top_n=self.fusion_top_n,
             reranker_threshold=self.reranker_threshold,
+            reranker_backend=self.reranker_backend,
+            reranker_max_length=self.reranker_max_length,
+            reranker_type_max_length=self.reranker_type_max_length,
+            reranker_bucket_size=self.reranker_bucket_size,
+            reranker_batch_size=self.reranker_batch_size,
+            reranker_max_wait_ms=self.reranker_max_wait_ms,
+            reranker_cache_size=self.reranker_cache_size,
+            reranker_cache_path=self.reranker_cache_path,
+            reranker_cache_max_entries=self.reranker_cache_max_entries,
+            reranker_cache_ttl=self.reranker_cache_ttl,
             num_retrieved=self.num_retrieved,
+            embedding_cache_size=self.embedding_cache_size,
+            embedding_cache_ttl=self.embedding_cache_ttl,
+            translation_cache_size=self.translation_cache_size,
+            translation_cache_path=self.translation_cache_path,
+            translation_cache_max_entries=self.translation_cache_max_entries,
+            translation_cache_ttl=self.translation_cache_ttl,
+            answer_cache_size=self.answer_cache_size,
+            answer_cache_threshold=self.answer_cache_threshold,
+            answer_cache_ttl=self.answer_cache_ttl,
             reader_prompt=self.reader_prompt,
             translation_prompt=self.translation_prompt,
             reader_models=self.reader_models,
             translation_model=self.translation_model,
-            ghazal_path='data/ghazal_documents.pkl',
-            masnavi_path='data/masnavi_documents.pkl',
-            programs_path='data/programs_documents.pkl',
+            ghazal_path='data/ghazal_documents.parquet',
+            masnavi_path='data/masnavi_documents.parquet',
+            programs_path='data/programs_documents.parquet',
+            embeddings_path='data/embeddings.parquet',
             dotenv_path=self.dotenv_path
         )
     
     @bentoml.api
-    def rag(self, query: str, model_category: str, selected_types: list) -> Dict[str, object]:
+    async def rag(self, query: str, model_category: str, selected_types: list) -> Dict[str, object]:
         if model_category not in self.reader_models.keys():
             print(f"Model category {model_category} does not exists.")
             return {}
         
-        response = self.rag_service.query(query, model_category, selected_types)
+        response = await self.rag_service.aquery(query, model_category, selected_types)
 
         # Return the response, while stripping everything unnecessary.
         return {
             'answer': response['answer'],
             'references': response['context']
-        }
\ No newline at end of file
+        }
+
+    @bentoml.api
+    async def rag_stream(self, query: str, model_category: str, selected_types: list) -> AsyncGenerator[str, None]:
+        # Newline delimited JSON: one line with the references, then one line per answer token
+        if model_category not in self.reader_models.keys():
+            print(f"Model category {model_category} does not exists.")
+            return
+
+        async for event in self.rag_service.astream(query, model_category, selected_types):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    @bentoml.api
+    def cache_stats(self) -> Dict[str, object]:
+        return self.rag_service.cache_stats()
+
+    @bentoml.api
+    def pool_stats(self) -> Dict[str, object]:
+        return self.rag_service.pool_stats()